@@ -0,0 +1,49 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Per-call overhead of FluidSynth bindings, as fluid_synth_noteon calls/s. Run from repository root:
+  python3 benchmarks/ctypes_calls.py [-n 200000]
+
+Compares a CFUNCTYPE prototype with paramflags (createLibrary default), plain CDLL function with argtypes
+(createLibrary fast=True, as FluidSynth.py is generated), and the Synth.noteon / NoteSynth.audition wrappers on top.
+No SoundFont is loaded, so FluidSynth refuses notes right away and the binding cost dominates.
+'''
+
+from argparse import ArgumentParser
+from ctypes import c_int, c_void_p
+from time import perf_counter
+import sys
+
+sys.path.insert(0, ".")
+
+def callRate(op, n, repeat=3) -> float:
+  """best calls/s of op(i) for i in range(n)"""
+  best = float("inf")
+  for _ in range(repeat):
+    t0 = perf_counter()
+    for i in range(n): op(i)
+    best = min(best, perf_counter() - t0)
+  return n / best
+
+def main():
+  app = ArgumentParser(prog="ctypes_calls", description="benchmark FluidSynth call overhead of binding modes")
+  app.add_argument("-n", type=int, default=200000, help="calls per case")
+  cfg = app.parse_args()
+  from hachiko_bapu.funutils import createLibrary
+  from hachiko_bapu.FluidSynth import lib_path
+  from hachiko_bapu.synthesize import NoteSynth
+
+  synth = NoteSynth(44100)
+  args = (("synth", c_void_p), ("chan", c_int), ("key", c_int), ("vel", c_int))
+  noteons = {
+    "paramflags": createLibrary(lib_path)("fluid_synth_noteon", c_int, *args),
+    "fast": createLibrary(lib_path, fast=True)("fluid_synth_noteon", c_int, *args)
+  }
+  rates = {name: callRate(lambda i: f(synth.synth, 0, i & 0x7f, 100), cfg.n) for (name, f) in noteons.items()}
+  rates["Synth.noteon"] = callRate(lambda i: synth.noteon(i & 0x7f), cfg.n)
+  rates["NoteSynth.audition"] = callRate(lambda i: synth.audition(i & 0x7f), cfg.n)
+  for (name, rate) in rates.items():
+    print(f"{name:20} {rate:14,.0f} calls/s {1e6/rate:8.3f} us/call ({rate/rates['paramflags']:.2f}x paramflags)")
+
+if __name__ == "__main__": main()
@@ -0,0 +1,167 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Benchmarks for conversion and synthesis hot paths, on synthetic data. Run from repository root:
+  python3 benchmarks/hotpaths.py [-n 100000] [-only name,...] [-o results.json]
+
+For each case it reports best-of-repeat wall time, throughput (items/s) and peak traced memory,
+-o also writes them as JSON so results of two builds can be compared.
+'''
+
+from argparse import ArgumentParser
+from datetime import timedelta
+from json import dump
+from random import Random
+from subprocess import run, PIPE, DEVNULL
+from time import perf_counter
+import platform, sys, tracemalloc
+
+sys.path.insert(0, ".")
+from srt import Subtitle
+
+def randomPitches(n, seed=0):
+  """n monophonic (t1, t2, pitch) notes with random gaps"""
+  rnd = Random(seed); t = 0.0; notes = []
+  for _ in range(n):
+    t1 = t + rnd.uniform(0.0, 0.3); t2 = t1 + rnd.uniform(0.05, 0.8)
+    notes.append((round(t1, 3), round(t2, 3), rnd.randrange(40, 80)))
+    t = t2
+  return notes
+
+def randomWords(n, seed=0):
+  """n words in sentences: (seconds, word), pauses between sentences are longer than 1s"""
+  rnd = Random(seed); t = 0.0; words = []
+  for i in range(n):
+    t += rnd.uniform(1.2, 3.0) if i % rnd.randrange(4, 12) == 0 else rnd.uniform(0.1, 0.5)
+    words.append((t, "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rnd.randrange(1, 8)))))
+  return words
+
+def lrcText(words, n_per_line=16):
+  """word-level LRC stream, [mm:ss.xxx] for first word and <mm:ss.xxx> for others in each line of n_per_line words"""
+  entry = lambda t, s, surr: "%s%02i:%02i.%03i%s%s" %(surr[0], t//60, t%60, int(t%1.0 * 1000), surr[1], s)
+  lines = [words[i:i+n_per_line] for i in range(0, len(words), n_per_line)]
+  return "\n".join("".join(entry(t, s, "<>" if i != 0 else "[]") for (i, (t, s)) in enumerate(line)) for line in lines)
+
+def asSubtitles(notes):
+  td = lambda s: timedelta(seconds=s)
+  return [Subtitle(i+1, td(t1), td(t2), str(content)) for (i, (t1, t2, content)) in enumerate(notes)]
+
+def multiTrackMidi(n, n_track=4, seed=0):
+  """mido MidiFile with n notes over n_track tracks (tempo map in track 0), notes may overlap"""
+  from mido import MidiFile, MidiTrack, Message, MetaMessage
+  rnd = Random(seed)
+  midi = MidiFile(ticks_per_beat=480)
+  midi.tracks.append(MidiTrack([MetaMessage("set_tempo", tempo=500000), MetaMessage("set_tempo", tempo=400000, time=480*64)]))
+  for i in range(n_track):
+    events = []
+    for _ in range(n // n_track):
+      t1 = rnd.randrange(0, n*240); t2 = t1 + rnd.randrange(1, 960); pitch = rnd.randrange(40, 80)
+      events += [(t1, 1, pitch), (t2, 0, pitch)]
+    events.sort()
+    (track, t0) = (MidiTrack(), 0)
+    for (t, is_on, pitch) in events:
+      track.append(Message("note_on" if is_on else "note_off", channel=i, note=pitch, time=t-t0)); t0 = t
+    midi.tracks.append(track)
+  return midi
+
+cases = {} # name: n -> (op, n_items)
+def case(name):
+  def register(setup): cases[name] = setup; return setup
+  return register
+
+@case("srt2mid.transform")
+def _(n):
+  from hachiko_bapu.cli_tools.srt2mid import transform
+  from hachiko_bapu.timeline import Timeline
+  timeline = Timeline.fromRows((t1, t2, pitch, 64, None) for (t1, t2, pitch) in randomPitches(n))
+  return (lambda: transform(timeline, False), n)
+
+@case("srt2mid.transformBack")
+def _(n):
+  from hachiko_bapu.cli_tools.srt2mid import transformBack
+  midi = multiTrackMidi(n)
+  return (lambda: transformBack(midi, False), n)
+
+@case("lrc_merge.readLrc")
+def _(n):
+  from hachiko_bapu.cli_tools.lrc_merge import readLrc
+  text = lrcText(randomWords(n))
+  return (lambda: readLrc(text), n)
+
+@case("lrc_merge.zipTakeWhile")
+def _(n):
+  from hachiko_bapu.cli_tools.lrc_merge import zipTakeWhile
+  srts = asSubtitles([(t, t+0.1, s) for (t, s) in randomWords(n)])
+  inSameLine = lambda a, b: abs(a.end - b.start).total_seconds() < 0.8
+  return (lambda: list(zipTakeWhile(inSameLine, srts)), n)
+
+@case("lrc_merge.intoSrt")
+def _(n):
+  from hachiko_bapu.cli_tools.lrc_merge import zipTakeWhile, intoSrt
+  srts = asSubtitles([(t, t+0.1, s) for (t, s) in randomWords(n)])
+  lines = list(zipTakeWhile(lambda a, b: abs(a.end - b.start).total_seconds() < 0.8, srts))
+  return (lambda: list(intoSrt(lines)), n)
+
+@case("lrc_merge.dumpLrc")
+def _(n):
+  from hachiko_bapu.cli_tools.lrc_merge import dumpLrc
+  words = randomWords(n)
+  lines = [words[i:i+8] for i in range(0, len(words), 8)]
+  return (lambda: dumpLrc(lines), n)
+
+@case("hachi.AsSrt.finish")
+def _(n):
+  from hachiko_bapu.hachi import AsSrt
+  rec = AsSrt()
+  for note in randomPitches(n): rec.accept(note)
+  return (rec.finish, n)
+
+@case("NoteSynth.render_block")
+def _(n):
+  from hachiko_bapu.synthesize import NoteSynth #< needs FluidSynth library
+  synth = NoteSynth(44100)
+  for pitch in (45, 52, 57): synth.noteon(pitch)
+  n_block = 1024
+  def render():
+    for _ in range(max(1, n // n_block)): synth.render_block(n_block)
+  return (render, max(1, n // n_block) * n_block)
+
+def measure(setup, n, repeat):
+  (op, n_items) = setup(n)
+  times = []
+  for _ in range(repeat):
+    t0 = perf_counter(); op(); times.append(perf_counter() - t0)
+  tracemalloc.start() #< separate run, tracing slows down the timed ones
+  op()
+  (_, peak) = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  best = min(times)
+  return {"items": n_items, "seconds": best, "items_per_sec": n_items / best, "peak_bytes": peak}
+
+def gitRevision():
+  try: return run(["git", "rev-parse", "--short", "HEAD"], stdout=PIPE, stderr=DEVNULL, universal_newlines=True).stdout.strip() or None
+  except OSError: return None
+
+def main():
+  app = ArgumentParser(prog="hotpaths", description="benchmark conversion and synthesis hot paths")
+  app.add_argument("-n", type=int, default=100000, help="items (notes, words, samples) per case")
+  app.add_argument("-repeat", type=int, default=3, help="timed runs per case, best is kept")
+  app.add_argument("-only", type=str, default=None, help="comma separated case names")
+  app.add_argument("-o", type=str, default=None, help="JSON result file")
+  cfg = app.parse_args()
+  names = cfg.only.split(",") if cfg.only != None else list(cases.keys())
+
+  results = {}
+  for name in names:
+    try: res = measure(cases[name], cfg.n, cfg.repeat)
+    except (ImportError, OSError) as ex: #< e.g. FluidSynth or numpy is missing
+      print(f"{name:26} skipped: {ex}"); results[name] = {"skipped": str(ex)}; continue
+    results[name] = res
+    print(f"{name:26} {res['seconds']*1000:10.1f} ms {res['items_per_sec']:14,.0f} items/s {res['peak_bytes']/2**20:9.1f} MiB peak")
+
+  if cfg.o != None:
+    meta = {"revision": gitRevision(), "python": platform.python_version(), "machine": platform.machine(), "n": cfg.n}
+    with open(cfg.o, "w") as f: dump({"meta": meta, "results": results}, f, indent=2)
+
+if __name__ == "__main__": main()
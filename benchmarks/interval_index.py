@@ -0,0 +1,62 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Interval index queries on a large synthetic timeline. Run from repository root:
+  python3 benchmarks/interval_index.py [-n 1000000] [-queries 10000] [-window 2.0]
+
+Reports build time, recording-order insertion rate and microseconds per overlap / nearest query.
+'''
+
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+import sys
+
+sys.path.insert(0, ".")
+sys.path.insert(0, "benchmarks")
+from hotpaths import randomPitches
+
+def polyphonic(n, seed=0):
+  """randomPitches with a long pedal note every 1000 notes, so the prefix maximum of ends is often held up"""
+  notes = randomPitches(n, seed)
+  return [(t1, t2 + 30.0 if i % 1000 == 0 else t2) for (i, (t1, t2, _)) in enumerate(notes)]
+
+def timed(op, n):
+  t0 = perf_counter(); op(); dt = perf_counter() - t0
+  return dt, dt / max(n, 1) * 1e6
+
+def main():
+  app = ArgumentParser(prog="interval_index", description="benchmark IntervalIndex queries")
+  app.add_argument("-n", type=int, default=1000000, help="notes in timeline")
+  app.add_argument("-queries", type=int, default=10000, help="queries of each kind")
+  app.add_argument("-window", type=float, default=2.0, help="overlap query window in seconds")
+  app.add_argument("-no-numpy", action="store_true", default=False, help="use pure Python paths")
+  cfg = app.parse_args()
+  from hachiko_bapu import interval_index
+  from hachiko_bapu.interval_index import IntervalIndex
+  if cfg.no_numpy: interval_index.numpy = None
+
+  notes = polyphonic(cfg.n)
+  (starts, ends) = ([t1 for (t1, _) in notes], [t2 for (_, t2) in notes])
+  index = None
+  def build():
+    nonlocal index; index = IntervalIndex.fromColumns(starts, ends)
+  (dt, _) = timed(build, cfg.n)
+  print(f"{'build':10} {dt*1000:10.1f} ms for {cfg.n:,} notes")
+  recorded = IntervalIndex()
+  (dt, us) = timed(lambda: [recorded.insert(t1, t2, i) for (i, (t1, t2)) in enumerate(notes)], cfg.n)
+  print(f"{'insert':10} {dt*1000:10.1f} ms {us:10.3f} us/note (recording order)")
+
+  rnd = Random(1); t_end = notes[-1][1]
+  points = [rnd.uniform(0, t_end) for _ in range(cfg.queries)]
+  n_found = 0
+  def overlaps():
+    nonlocal n_found
+    for t in points: n_found += len(index.overlapping(t, t + cfg.window))
+  (dt, us) = timed(overlaps, cfg.queries)
+  print(f"{'overlap':10} {dt*1000:10.1f} ms {us:10.3f} us/query ({n_found / cfg.queries:.1f} notes per {cfg.window}s window)")
+  (dt, us) = timed(lambda: [index.nearest(t) for t in points], cfg.queries)
+  print(f"{'nearest':10} {dt*1000:10.1f} ms {us:10.3f} us/query")
+
+if __name__ == "__main__": main()
@@ -0,0 +1,95 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Onset drift/jitter of offline playback: scheduled note onsets against where they land in rendered audio. Run from repository root:
+  python3 benchmarks/sequencer_drift.py [-n 200] [-block 1024] [-sample-rate 44100]
+
+Compares Sequencer (write_s16 calls split at events) with events applied at block starts,
+as timers feeding a block-pulling audio driver do at best. For each it reports the frames events were applied at,
+and onsets found in the audio (first sample above -threshold after silence; FluidSynth itself starts voices on 64-frame boundaries).
+Needs FluidSynth library and a SoundFont (SFONT env-var, default instrument.sf2 of the package).
+'''
+
+from argparse import ArgumentParser
+from io import BytesIO
+from random import Random
+import sys
+
+sys.path.insert(0, ".")
+from hachiko_bapu.hachitools import percentiles
+
+def staccatoNotes(n, seed=0):
+  """n short (t1, t2, pitch) notes, each followed by a rest long enough for its release to fade"""
+  rnd = Random(seed); t = 0.5; notes = []
+  for _ in range(n):
+    t1 = t + rnd.uniform(0.0, 0.1); t2 = t1 + rnd.uniform(0.05, 0.15)
+    notes.append((t1, t2, rnd.randrange(50, 70)))
+    t = t2 + 1.0
+  return notes
+
+def renderBlocks(synth, notes, out, n_block, n_tail=1.0):
+  """baseline: events due inside a block are applied at its start. Returns (scheduled, applied) frames"""
+  from hachiko_bapu.synthesize import noteEvents
+  events = noteEvents(notes, synth.sample_rate)
+  n_total = events[-1][0] + int(n_tail*synth.sample_rate)
+  applied = []; i = 0
+  for pos in range(0, n_total, n_block):
+    while i < len(events) and events[i][0] < pos + n_block:
+      (at, is_on, pitch) = events[i]
+      if is_on: synth.noteon(pitch)
+      else: synth.noteoff(pitch)
+      applied.append((at, pos)); i += 1
+    out.write(synth.render_block(min(n_block, n_total - pos)))
+  return applied
+
+def onsets(pcm:bytes, threshold:int, n_gap:int):
+  """frames where left channel exceeds threshold after n_gap quiet frames"""
+  from array import array
+  left = array("h", pcm)[0::2]
+  found = []; quiet = n_gap
+  for (i, x) in enumerate(left):
+    if abs(x) > threshold:
+      if quiet >= n_gap: found.append(i)
+      quiet = 0
+    else: quiet += 1
+  return found
+
+def report(name, pairs, rate):
+  """pairs of (scheduled, rendered) frames: drift is median offset, jitter the spread around it"""
+  offsets = [b - a for (a, b) in pairs]
+  (drift,) = percentiles(offsets, (50,))
+  (j50, j95, j99) = percentiles([abs(d - drift) for d in offsets])
+  ms = lambda n: n / rate * 1000
+  print(f"{name:22} {len(pairs):5} events, drift {ms(drift):7.2f}ms, jitter p50 {ms(j50):.2f}ms p95 {ms(j95):.2f}ms p99 {ms(j99):.2f}ms, max {ms(max(map(abs, offsets), default=0)):.2f}ms")
+
+def main():
+  app = ArgumentParser(prog="sequencer_drift", description="compare scheduled and rendered note onsets")
+  app.add_argument("-n", type=int, default=200, help="notes in timeline")
+  app.add_argument("-block", type=int, default=1024, help="frames per block (audio driver period)")
+  app.add_argument("-sample-rate", type=int, default=44100, help="synth sample rate")
+  app.add_argument("-threshold", type=int, default=200, help="onset level in s16 samples")
+  cfg = app.parse_args()
+  from hachiko_bapu.synthesize import NoteSynth, Sequencer
+  from hachiko_bapu.render import INSTRUMENT_SF2
+
+  notes = staccatoNotes(cfg.n)
+  rate = cfg.sample_rate
+  scheduled = [round(t1*rate) for (t1, _, _) in notes]
+  def newSynth():
+    synth = NoteSynth(rate); synth.setFont(INSTRUMENT_SF2)
+    return synth
+
+  seq_out = BytesIO()
+  seq = Sequencer(newSynth(), notes); seq.render(seq_out, n_block=cfg.block)
+  blk_out = BytesIO()
+  blk_applied = renderBlocks(newSynth(), notes, blk_out, cfg.block)
+  report("sequencer applied", seq.applied, rate)
+  report(f"blocks/{cfg.block} applied", blk_applied, rate)
+
+  for (name, out) in [("sequencer onsets", seq_out), (f"blocks/{cfg.block} onsets", blk_out)]:
+    found = onsets(out.getvalue(), cfg.threshold, int(0.5*rate))
+    if len(found) != len(scheduled): print(f"{name:22} found {len(found)} onsets for {len(scheduled)} notes (lost in blocks, or try another -threshold)"); continue
+    report(name, list(zip(scheduled, found)), rate)
+
+if __name__ == "__main__": main()
@@ -0,0 +1,51 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Cold-start benchmark for command entry points, run from repository root:
+  python3 benchmarks/startup.py [-n 10] [-importtime]
+
+Each command is started as a fresh interpreter n times and the median wall time is reported,
+-importtime also lists the slowest imports (cumulative, from python -X importtime).
+'''
+
+from argparse import ArgumentParser
+from subprocess import run, DEVNULL, PIPE
+from statistics import median
+from time import perf_counter
+from sys import executable
+
+commands = {
+  "hachiko -h": ["-m", "hachiko_bapu.hachi", "-h"],
+  "srt2mid": ["-m", "hachiko_bapu.cli_tools.srt2mid"],
+  "python (baseline)": ["-c", "pass"]
+}
+
+def coldStart(args, n):
+  times = []
+  for _ in range(n):
+    t0 = perf_counter()
+    run([executable, *args], stdout=DEVNULL, stderr=DEVNULL)
+    times.append(perf_counter() - t0)
+  return median(times)
+
+def slowestImports(args, n_top):
+  err = run([executable, "-X", "importtime", *args], stdout=DEVNULL, stderr=PIPE, universal_newlines=True).stderr
+  rows = []
+  for line in err.splitlines():
+    if not line.startswith("import time:") or "cumulative" in line: continue
+    (_, cumulative, name) = line[len("import time:"):].split("|")
+    rows.append((int(cumulative), name.rstrip()))
+  return sorted(rows, reverse=True)[:n_top]
+
+def main():
+  app = ArgumentParser(prog="startup", description="measure cold-start time of hachiko entry points")
+  app.add_argument("-n", type=int, default=10, help="runs per command")
+  app.add_argument("-importtime", action="store_true", default=False, help="list slowest imports")
+  cfg = app.parse_args()
+  for (name, args) in commands.items():
+    print(f"{name:20} {coldStart(args, cfg.n)*1000:8.1f} ms")
+    if cfg.importtime:
+      for (us, module) in slowestImports(args, 8): print(f"  {us/1000:8.1f} ms {module}")
+
+if __name__ == "__main__": main()
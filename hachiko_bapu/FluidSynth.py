@@ -1,13 +1,13 @@
 # -*- coding: utf-8 -*-
 from .funutils import findLibrary, createLibrary
 # DO NOT EDIT
-#This file was generated by ./funutils.py fluidsynth.h FluidSynth libfluidsynth-2 libfluidsynth-1 libfluidsynth fluidsynth
+#This file was generated by ./funutils.py --fast fluidsynth.h FluidSynth libfluidsynth-2 libfluidsynth-1 libfluidsynth fluidsynth
 
 lib_names = ['libfluidsynth-2', 'libfluidsynth-1', 'libfluidsynth', 'fluidsynth']
 lib_path = findLibrary('FluidSynth', lib_names)
-cfunc = createLibrary(lib_path)
+cfunc = createLibrary(lib_path, fast=True)
 
-from ctypes import c_char_p, c_double, c_int, c_void_p
+from ctypes import c_char_p, c_double, c_int, c_short, c_void_p
 
 new_fluid_settings = cfunc('new_fluid_settings', c_void_p)
 delete_fluid_settings = cfunc('delete_fluid_settings', None,
@@ -22,6 +22,14 @@ fluid_settings_setnum = cfunc('fluid_settings_setnum', c_int,
   ('settings', c_void_p), ('name', c_char_p), ('val', c_double))
 fluid_settings_setint = cfunc('fluid_settings_setint', c_int,
   ('settings', c_void_p), ('name', c_char_p), ('val', c_int))
+fluid_settings_getint = cfunc('fluid_settings_getint', c_int,
+  ('settings', c_void_p), ('name', c_char_p), ('val', c_void_p))
+fluid_settings_getnum = cfunc('fluid_settings_getnum', c_int,
+  ('settings', c_void_p), ('name', c_char_p), ('val', c_void_p))
+fluid_settings_copystr = cfunc('fluid_settings_copystr', c_int,
+  ('settings', c_void_p), ('name', c_char_p), ('str', c_void_p), ('len', c_int))
+fluid_settings_getint_range = cfunc('fluid_settings_getint_range', c_int,
+  ('settings', c_void_p), ('name', c_char_p), ('min', c_void_p), ('max', c_void_p))
 fluid_synth_sfload = cfunc('fluid_synth_sfload', c_int,
   ('synth', c_void_p), ('filename', c_char_p), ('update_midi_presets', c_int))
 fluid_synth_sfunload = cfunc('fluid_synth_sfunload', c_int,
@@ -32,8 +40,43 @@ fluid_synth_noteon = cfunc('fluid_synth_noteon', c_int,
   ('synth', c_void_p), ('chan', c_int), ('key', c_int), ('vel', c_int))
 fluid_synth_noteoff = cfunc('fluid_synth_noteoff', c_int,
   ('synth', c_void_p), ('chan', c_int), ('key', c_int))
+fluid_synth_cc = cfunc('fluid_synth_cc', c_int,
+  ('synth', c_void_p), ('chan', c_int), ('num', c_int), ('val', c_int))
+fluid_synth_pitch_bend = cfunc('fluid_synth_pitch_bend', c_int,
+  ('synth', c_void_p), ('chan', c_int), ('val', c_int))
 fluid_synth_write_s16 = cfunc('fluid_synth_write_s16', None,
   ('synth', c_void_p), ('len', c_int), ('lbuf', c_void_p), ('loff', c_int), ('lincr', c_int), ('rbuf', c_void_p), ('roff', c_int), ('rincl', c_int))
+fluid_synth_write_float = cfunc('fluid_synth_write_float', c_int,
+  ('synth', c_void_p), ('len', c_int), ('lout', c_void_p), ('loff', c_int), ('lincr', c_int), ('rout', c_void_p), ('roff', c_int), ('rincr', c_int))
+fluid_synth_process = cfunc('fluid_synth_process', c_int,
+  ('synth', c_void_p), ('len', c_int), ('nfx', c_int), ('fx', c_void_p), ('nout', c_int), ('out', c_void_p))
+new_fluid_sequencer2 = cfunc('new_fluid_sequencer2', c_void_p,
+  ('use_system_timer', c_int))
+delete_fluid_sequencer = cfunc('delete_fluid_sequencer', None,
+  ('seq', c_void_p))
+fluid_sequencer_register_fluidsynth = cfunc('fluid_sequencer_register_fluidsynth', c_short,
+  ('seq', c_void_p), ('synth', c_void_p))
+fluid_sequencer_unregister_client = cfunc('fluid_sequencer_unregister_client', None,
+  ('seq', c_void_p), ('id', c_short))
+fluid_sequencer_get_tick = cfunc('fluid_sequencer_get_tick', c_int,
+  ('seq', c_void_p))
+fluid_sequencer_set_time_scale = cfunc('fluid_sequencer_set_time_scale', None,
+  ('seq', c_void_p), ('scale', c_double))
+fluid_sequencer_send_at = cfunc('fluid_sequencer_send_at', c_int,
+  ('seq', c_void_p), ('evt', c_void_p), ('time', c_int), ('absolute', c_int))
+fluid_sequencer_process = cfunc('fluid_sequencer_process', None,
+  ('seq', c_void_p), ('msec', c_int))
+new_fluid_event = cfunc('new_fluid_event', c_void_p)
+delete_fluid_event = cfunc('delete_fluid_event', None,
+  ('evt', c_void_p))
+fluid_event_set_source = cfunc('fluid_event_set_source', None,
+  ('evt', c_void_p), ('src', c_short))
+fluid_event_set_dest = cfunc('fluid_event_set_dest', None,
+  ('evt', c_void_p), ('dest', c_short))
+fluid_event_noteon = cfunc('fluid_event_noteon', None,
+  ('evt', c_void_p), ('channel', c_int), ('key', c_short), ('vel', c_short))
+fluid_event_noteoff = cfunc('fluid_event_noteoff', None,
+  ('evt', c_void_p), ('channel', c_int), ('key', c_short))
 new_fluid_audio_driver = cfunc('new_fluid_audio_driver', c_void_p,
   ('settings', c_void_p), ('synth', c_void_p))
 delete_fluid_audio_driver = cfunc('delete_fluid_audio_driver', None,
@@ -1 +1 @@
-__all__ = ["hachi", "hachi_groups", "hachitools", "synthesize"]
+__all__ = ["hachi", "hachi_groups", "hachitools", "interval_index", "probe", "render", "synthesize", "timeline", "timeline_file"]
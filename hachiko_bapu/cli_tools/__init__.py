@@ -1 +1 @@
-__all__ = ["lrc_merge", "srt2mid"]
+__all__ = ["lrc_merge", "midi_scan", "srt2mid"]
@@ -10,11 +10,18 @@ Model: Lrc / LrcLines(Subtitle[]) / Srt
 
 read: str -> Lrc; dump: LrcLines -> str;
 str (into)<=>(from) LrcLines
+
+All of them are streams: words are grouped into lines in one pass (one word lookahead),
+and lines are collected (with one line lookahead) into Timelines of up to N_BATCH sentences, each written as SRT at once,
+so memory is bound by the longest line and one batch.
 '''
 
 from datetime import timedelta
 from srt import Subtitle, compose
-from srt import parse as fromSrt
+
+from .srt2mid import readSrtStream
+from ..timeline import Timeline, NO_PITCH, N_BATCH, formatLrcLines
+from ..hachitools import EXT_TIMELINE
 
 from os import linesep
 
@@ -22,25 +29,26 @@ def require(value, p, msg = "bad"):
   if not p(value): raise ValueError(f"{msg}: {value}")
 
 def zipWithNext(xs):
-  require(xs, lambda it: len(it) > 2, "must >2")
-  for i in range(1, len(xs)):
-    yield (xs[i-1], xs[i])
+  it = iter(xs)
+  a = next(it, None)
+  for b in it:
+    yield (a, b)
+    a = b
 
 def zipTakeWhile(predicate, xs):
-  require(xs, lambda it: len(it) > 1)
-  col = [xs[0]]
-  for (a, b) in zipWithNext(xs):
-    if not predicate(a, b):
+  it = iter(xs)
+  try: col = [next(it)]
+  except StopIteration: return
+  for b in it:
+    if not predicate(col[-1], b):
       yield col
       col = []
     col.append(b)
   yield col #< even predicate matches
 
 def flatMap(transform, xs):
-  res = []
   for ys in map(transform, xs):
-    for y in ys: res.append(y)
-  return res
+    yield from ys
 
 def map2D(f, xss):
   ''' map [[a]] with function f '''
@@ -51,42 +59,132 @@ def cfgOrDefault(value, f, x):
 
 
 from re import compile
+from itertools import chain
+
+try: import numpy
+except ImportError: numpy = None #< LRC timestamps are converted one by one instead
 PAT_LRC_ENTRY = compile(r"[\[<](\d{2}):(\d{2}).(\d{2,3})[>\]] ?([^<\n]*)")
 
 sepDeft = lambda line: ("" if all(map(lambda w: len(w) == 1, line)) else " ")
 
 def readLrc(text):
-  def readEntry(g): return (int(g[0])*60 + int(g[1]) + int(g[2].zfill(3)) / 1000, g[3]) # [mm:ss.xx] content
-  return [readEntry(e) for e in PAT_LRC_ENTRY.findall(text)]
+  return list(scanLrc([text.encode("utf-8")]))
+
+N_CHUNK = 1 << 20
+def lrcChunks(f, n_chunk=N_CHUNK):
+  """binary file (or mmap) into chunks for scanLrc"""
+  return iter(lambda: f.read(n_chunk), b"")
+
+PAT_LRC_SPLIT = compile(rb"[\[<](\d\d:\d\d[^\n]\d{2,3})[>\]] ?([^<\n\r]*)") #< same entries as PAT_LRC_ENTRY
+PAT_LRC_TAG = compile(rb"\[([A-Za-z]+):([^\]\n]*)\]")
+DIGITS2 = {b"%02d" %i: i for i in range(100)}
+FRAC_MS = {**{b"%02d" %i: i*10 for i in range(100)}, **{b"%03d" %i: i for i in range(1000)}} #< [mm:ss.xx] are centiseconds
+
+def lrcSeconds(headers):
+  """b"mm:ss.xx(x)" headers to seconds, as one numpy operation when they have same width, or by digit tables"""
+  if numpy != None and len(headers) != 0:
+    width = len(headers[0]); joined = b"".join(headers)
+    if len(joined) == width*len(headers): #< all 8 or all 9 bytes wide
+      d = numpy.frombuffer(joined, dtype=numpy.uint8).reshape(-1, width).astype(numpy.int64) - 0x30
+      frac = d[:,6]*100 + d[:,7]*10 + d[:,8] if width == 9 else (d[:,6]*10 + d[:,7])*10
+      return ((d[:,0]*10 + d[:,1])*60 + d[:,3]*10 + d[:,4] + frac/1000).tolist()
+  return [DIGITS2[h[:2]]*60 + DIGITS2[h[3:5]] + FRAC_MS[h[6:]]/1000 for h in headers]
+
+def scanLrc(chunks, meta=None, encoding="utf-8"):
+  """Tokenize (seconds, content) LRC entries (as PAT_LRC_ENTRY) lazily from bytes chunks (see lrcChunks).
+  Tokens never span lines, so each chunk is scanned until its last newline and the rest is joined with next chunk;
+  timestamps of a chunk are converted in batch, never through str and int().
+  Tags like [ar:name] are kept in meta dict, [offset:+/-ms] shifts entries after it (positive is earlier).
+  """
+  if meta == None: meta = {}
+  k_offset = 0.0
+  rest = b""
+  for chunk in chain(chunks, [None]):
+    if chunk == None: (buf, end) = (rest, len(rest))
+    else:
+      buf = rest + chunk if len(rest) != 0 else chunk
+      end = buf.rfind(b"\n") + 1
+    region = buf[:end]; rest = buf[end:]
+    parts = PAT_LRC_SPLIT.split(region) #< [text, header, content, text, ...]
+    times = lrcSeconds(parts[1::3])
+    texts = [content.decode(encoding) for content in parts[2::3]]
+    if PAT_LRC_TAG.search(region) == None:
+      yield from zip(times, texts) if k_offset == 0.0 else ((t - k_offset, s) for (t, s) in zip(times, texts))
+      continue
+    for (i, text) in enumerate(parts[0::3]): #< slow path for chunks with tags, they apply to entries after them
+      for (tag, value) in PAT_LRC_TAG.findall(text):
+        meta[tag.decode(encoding)] = value = value.decode(encoding).strip()
+        if tag == b"offset":
+          try: k_offset = int(value) / 1000
+          except ValueError: pass
+      if i < len(times): yield (times[i] - k_offset, texts[i])
+
+def dumpLrcLines(lrc_lines, sep = None, surr1 = "[]", surr2 = "<>"):
+  return formatLrcLines(lrc_lines, sep if sep != None else sepDeft, surr1, surr2) #< timestamps formatted in batch
 
 def dumpLrc(lrc_lines, sep = None, surr1 = "[]", surr2 = "<>"):
-  def header(t, surr): return "%s%02i:%02i.%02i%s" %(surr[0], t/60, t%60, t%1.0 * 100, surr[1])
-  def formatLine(line):
-    (t_fst, s_fst) = line[0]
-    fmtFst = header(t_fst, surr1)+s_fst
-    sep1 = cfgOrDefault(sep, sepDeft, map(lambda note: note[1], line))
-    return fmtFst +sep1+ sep1.join([header(t, surr2) + s for (t, s) in line[1:]])
-  return linesep.join(map(formatLine, lrc_lines))
+  return linesep.join(dumpLrcLines(lrc_lines, sep, surr1, surr2))
 
 
-def fromLrc(text, min_len):
+def fromLrcEntries(entries, min_len):
   td = lambda t: timedelta(seconds=t)
-  return [Subtitle(i+1, td(t), td(t+min_len), s) for i, (t, s) in enumerate(readLrc(text))]
+  return (Subtitle(i+1, td(t), td(t+min_len), s) for i, (t, s) in enumerate(entries))
+
+def fromLrc(text, min_len):
+  return list(fromLrcEntries(readLrc(text), min_len))
 
 def intoLrc(lines, sep=None): #v use join folding in dumpLrc
   return dumpLrc(map2D(lambda srt: (srt.start.total_seconds(), srt.content), lines), sep)
 
-def intoSrt(srts, sep=None):
+def intoSrt(srts, sep=None, n_batch=N_BATCH):
+  """lines of word Subtitles into Timelines of up to n_batch sentences, each sentence ends before next one starts"""
   def newContent(line):
     words = [srt.content for srt in line]
     return cfgOrDefault(sep, sepDeft, words).join(words)
   time = lambda it: it.start
-  return [Subtitle(i+1, min(line, key=time).start, min(T1[0].start,max(line, key=time).end), newContent(line)) for ((i, line),(_,T1)) in zipWithNext(list(enumerate(srts)))] #clip <T1
+  timeline = Timeline()
+  def addLine(line, T1):
+    end = max(line, key=time).end
+    if T1 != None: end = min(T1[0].start, end) #clip <T1
+    timeline.append(min(line, key=time).start.total_seconds(), end.total_seconds(), NO_PITCH, lyric=newContent(line))
+  it = iter(srts)
+  line = next(it, None)
+  for T1 in it:
+    addLine(line, T1)
+    line = T1
+    if len(timeline) >= n_batch: yield timeline; timeline = Timeline()
+  if line != None: addLine(line, None)
+  if len(timeline) != 0: yield timeline
+
+def writeSrt(out, timelines) -> int:
+  """write sentence Timelines (see intoSrt) to text file out in given order, numbered on. Returns count of sentences"""
+  n = 0
+  for timeline in timelines: n += timeline.writeSrt(out, reindex=False, start_index=n+1)
+  return n
 
 def readLines(name):
   print(f"input {name}, terminated by '.'")
   return iter(lambda: input(f"{name}>"), ".")
 
+def readLrcFile(path, min_len):
+  with open(path, "rb") as f: yield from fromLrcEntries(scanLrc(lrcChunks(f)), min_len)
+
+def readTimelineFile(path):
+  from ..timeline_file import TimelineFile
+  td = lambda t: timedelta(seconds=t)
+  with TimelineFile(path) as tf:
+    for (i, (t1, t2, pitch, _, lyric)) in enumerate(tf): yield Subtitle(i+1, td(t1), td(t2), lyric if lyric != None else str(pitch))
+
+def readSrtFile(path):
+  with open(path, "r", encoding="utf-8") as f: yield from readSrtStream(f)
+
+def readWords(file, min_len):
+  """word Subtitles from 'lrc' (stdin), a .lrc, binary timeline or SRT file, read lazily (files are closed once read)"""
+  if file == "lrc": return flatMap(lambda t: fromLrc(t, min_len), readLines("lrc"))
+  if file.lower().endswith(".lrc"): return readLrcFile(file, min_len)
+  if file.lower().endswith(EXT_TIMELINE): return readTimelineFile(file)
+  return readSrtFile(file)
+
 from sys import argv
 def main(args = argv[1:]):
   from argparse import ArgumentParser
@@ -97,22 +195,22 @@ def main(args = argv[1:]):
   app.add_argument("-min-len", type=float, default=0.0, help="min duration for last word in sentence (LRC only)")
   app.add_argument("-o", type=str, default="a.srt", help="ouput SRT file")
   app.add_argument("-sep", type=str, default=None, help="word seprator (or decided automatically from sentence)")
-  app.add_argument("file", type=str, help="input SRT file (or 'lrc' and input from stdin)")
+  app.add_argument("-echo", action="store_true", default=False, help="also print words of each line")
+  app.add_argument("file", type=str, help=f"input SRT, .lrc or {EXT_TIMELINE} file (or 'lrc' and input from stdin)")
 
   cfg = app.parse_args(args)
-  use_lrc = cfg.file == "lrc"
+  use_lrc = cfg.file == "lrc" or cfg.file.lower().endswith(".lrc")
   inSameLine = lambda a, b: abs((a.start if use_lrc else a.end) - b.start).total_seconds() < cfg.dist
 
-  #v regex findall has input size limitations...
-  data = list(flatMap(lambda t: fromLrc(t, cfg.min_len), readLines("lrc")) if use_lrc else fromSrt(open(cfg.file).read()))
-  print(" ".join([f"{srt.start.total_seconds()};{srt.content}" for srt in data]))
+  def printLines(lines): #< LRC of each line is printed once it's grouped, before SRT of it is written
+    for line in lines:
+      if cfg.echo: print(" ".join([f"{srt.start.total_seconds()};{srt.content}" for srt in line]))
+      print(intoLrc([line], cfg.sep))
+      yield line
 
   print("== lyrics")
-  result = list(zipTakeWhile(inSameLine, data) )
-  print(intoLrc(result, cfg.sep))
-
-  with open(cfg.o, "w+") as srtf:
-    srtf.write("".join(x.to_srt()for x in intoSrt(result, cfg.sep)))
+  lines = printLines(zipTakeWhile(inSameLine, readWords(cfg.file, cfg.min_len)))
+  with open(cfg.o, "w+") as srtf: writeSrt(srtf, intoSrt(lines, cfg.sep))
 
 #netease http://lrc.opqnext.com/editor/1842025914
 if __name__ == "__main__": main()
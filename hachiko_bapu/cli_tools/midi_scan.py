@@ -0,0 +1,77 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Fast note extractor for Standard MIDI Files, reads track chunks directly (no mido message objects)
+
+Note is Tuple[int, int, int, int, int] (track, start_tick, end_tick, pitch, velocity)
+note_on/note_off of the same (channel, pitch) are paired first-in first-out, so overlapping notes are kept apart
+'''
+
+from typing import Iterator, List, Tuple
+from struct import unpack_from
+
+Note = Tuple[int, int, int, int, int]
+
+def readHeader(data) -> Tuple[int, int, List[Tuple[int, int]]]:
+  """(format, ticks_per_beat, [(offset, length)] of MTrk chunks)"""
+  if data[0:4] != b"MThd": raise ValueError("not a MIDI file (no MThd)")
+  (n_head, fmt, _, division) = unpack_from(">IHHH", data, 4)
+  if division & 0x8000: raise ValueError("SMPTE time division is not supported")
+  tracks = []
+  i = 8 + n_head
+  while i+8 <= len(data):
+    (name, n) = (data[i:i+4], unpack_from(">I", data, i+4)[0])
+    if name == b"MTrk": tracks.append((i+8, min(n, len(data) - (i+8))))
+    i += 8 + n #< skip unknown chunks
+  return (fmt, division, tracks)
+
+def scanTrack(data, i_track:int, start:int, length:int) -> List[Note]:
+  """notes of one track chunk, ordered by start tick"""
+  notes = []; active = {} #< (channel<<7 | pitch): [(start, velocity)]
+  i, stop = start, start+length
+  tick = 0; status = 0
+  while i < stop:
+    dt = 0 #v variable-length delta time
+    while True:
+      b = data[i]; i += 1
+      dt = (dt << 7) | (b & 0x7f)
+      if b < 0x80: break
+    tick += dt
+    b = data[i]
+    if b >= 0x80: status = b; i += 1
+    elif status == 0: raise ValueError(f"running status without status byte at {i}")
+    kind = status & 0xf0
+    if kind == 0x90 or kind == 0x80:
+      key = ((status & 0x0f) << 7) | data[i]; vel = data[i+1]; i += 2
+      if kind == 0x90 and vel != 0: active.setdefault(key, []).append((tick, vel))
+      else:
+        ons = active.get(key)
+        if ons: (t_on, v_on) = ons.pop(0); notes.append((i_track, t_on, tick, key & 0x7f, v_on))
+    elif kind == 0xc0 or kind == 0xd0: i += 1
+    elif kind != 0xf0: i += 2
+    else: #< meta or sysex, both carry a length and cancel running status
+      if status == 0xff: i += 1
+      n = 0
+      while True:
+        b = data[i]; i += 1
+        n = (n << 7) | (b & 0x7f)
+        if b < 0x80: break
+      i += n; status = 0
+  for (key, ons) in active.items(): #< never released, end at last event
+    for (t_on, v_on) in ons: notes.append((i_track, t_on, tick, key & 0x7f, v_on))
+  notes.sort(key=lambda note: note[1])
+  return notes
+
+def scanNotes(path) -> Iterator[Note]:
+  """(track, start_tick, end_tick, pitch, velocity) for all notes, track by track"""
+  with open(path, "rb") as f: data = f.read()
+  (_, _, tracks) = readHeader(data)
+  for (i_track, (start, length)) in enumerate(tracks):
+    yield from scanTrack(data, i_track, start, length)
+
+def noteArray(path):
+  """scanNotes as numpy structured array of fields track, start, end, pitch, velocity"""
+  import numpy
+  dtype = [("track", numpy.int32), ("start", numpy.int64), ("end", numpy.int64), ("pitch", numpy.uint8), ("velocity", numpy.uint8)]
+  return numpy.array(list(scanNotes(path)), dtype=dtype)
@@ -1,104 +1,258 @@
 #!/bin/env python3
 # -*- coding: utf-8 -*-
 
-from typing import List, Iterator, cast
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, Tuple
 
-from datetime import timedelta
-from srt import Subtitle, parse as srt_parse, compose as srt_compose
-from mido import Message, MetaMessage, MidiFile, MidiTrack
+from srt import Subtitle, parse as srt_parse
 
-from sys import getdefaultencoding
-from os import environ
+from sys import getdefaultencoding, argv, stdout, stderr, exit
+from os import environ, walk, makedirs, remove, stat
+from os.path import basename, dirname, isdir, isfile, join, relpath, splitext
+from glob import glob, has_magic
+from argparse import ArgumentParser
+from io import StringIO
+from time import time
+from struct import pack
+from heapq import merge as heapq_merge
+
+from .midi_scan import scanNotes
+from ..hachitools import EXT_TIMELINE, DEFAULT_VELOCITY #< timeline modules load numpy, they're imported where notes are kept or .hkt is read
+if TYPE_CHECKING: #< annotations only, mido and timeline are loaded when used
+  from mido import Message, MidiFile
+  from ..timeline import Row, Timeline
 
 SEC_MS = 1000
 
 def env(name, transform, default): return transform(environ[name]) if name in environ else default
 SINGLE_TRACK = env("SINGLE_TRACK", bool, False)
-TICKS_PER_BEAT = env("TICKS_PER_BEAT", int, 500) #480? both for srt->mid and mid<-srt
+TICKS_PER_BEAT = env("TICKS_PER_BEAT", int, 500) #< for srt->mid, 1 tick is 1ms at default tempo
 NOTE_BASE = env("NOTE_BASE", int, 45)
 
-def transform(srtz:Iterator[Subtitle], is_lyrics:bool) -> MidiFile:
+def srtRows(srtz:Iterator[Subtitle], is_lyrics:bool) -> Iterator["Row"]:
+  """timeline rows of pitch (or lyrics, sung on NOTE_BASE) subtitles"""
+  for srt in srtz:
+    if is_lyrics: yield (srt.start.total_seconds(), srt.end.total_seconds(), NOTE_BASE, DEFAULT_VELOCITY, srt.content)
+    else: yield (srt.start.total_seconds(), srt.end.total_seconds(), int(srt.content), DEFAULT_VELOCITY, None)
+
+def transform(timeline:Iterable["Row"], is_lyrics:bool) -> "MidiFile":
+  from mido import Message, MetaMessage, MidiFile, MidiTrack #< mido is slow to import, only load it when used
   out = MidiFile(charset=getdefaultencoding(), ticks_per_beat=TICKS_PER_BEAT)
   track = MidiTrack()
   out.tracks.append(track)
 
-  timeof = lambda dt: int(dt.total_seconds()*SEC_MS)
   t0 = 0
-  for srt in srtz:
-    t1 = timeof(srt.start)
-    t2 = timeof(srt.end)
+  for (start, end, pitch, velocity, lyric) in timeline:
+    t1 = int(start*SEC_MS)
+    t2 = int(end*SEC_MS)
     if is_lyrics: #v const branches
-      track.append(MetaMessage("lyrics", text=srt.content, time=t1-t0))
-    note = NOTE_BASE if is_lyrics else int(srt.content) #< pitch from
-    track.append(Message("note_on", note=note, time=0 if is_lyrics else t1-t0))
-    track.append(Message("note_off", note=note, time=t2-t1))
+      track.append(MetaMessage("lyrics", text=lyric, time=t1-t0))
+    track.append(Message("note_on", note=pitch, velocity=velocity, time=0 if is_lyrics else t1-t0))
+    track.append(Message("note_off", note=pitch, time=t2-t1))
     t0 = t2
 
   return out
 
-def transformBack(notez:Iterator[Message], is_lyrics:bool, k_time:float) -> List[Subtitle]:
-  out = []
-  def read(ty, blanks = ["set_tempo"]):
-    note = next(notez)
-    if note.type != ty:
-      if note.type == "end_of_track": raise StopIteration("EOT")
-      while note.type in blanks: note = next(notez) #< jump off!
-      if note.type != ty: raise ValueError(f"unexpected msg {note}, expecting {ty}")
-    return note
-
-  timeof = lambda n: timedelta(seconds=n/k_time)
-  t_acc = timedelta(); lyric = None
-  index = 1 #< for subtitles
-  while True:
-    try:
-      if is_lyrics: lyric = read("lyrics")
-      on = read("note_on")
-      t_on = timeof(lyric.time if is_lyrics else on.time)
-      t_off = timeof(read("note_off").time)
-    except StopIteration: break #v pitch back
-    out.append(Subtitle(index, t_acc+t_on, t_acc+t_on+t_off, lyric.text if is_lyrics else str(on.note) ))
-    t_acc += (t_on + t_off)
-    index += 1
+def varInt(n:int) -> bytes:
+  """MIDI variable-length quantity, 7 bits per byte, big endian"""
+  bs = [n & 0x7f]; n >>= 7
+  while n != 0: bs.append(0x80 | (n & 0x7f)); n >>= 7
+  return bytes(reversed(bs))
 
-  return out
+def transformStream(timeline:Iterable["Row"], is_lyrics:bool, out) -> int:
+  """Write same MIDI file as transform(timeline, is_lyrics).save() into seekable binary out, event by event.
+  Track chunk length is back-patched at the end, so memory does not grow with input (when rows are streamed, see srtRows).
+  Returns count of written notes.
+  """
+  out.write(b"MThd" + pack(">IHHH", 6, 1, 1, TICKS_PER_BEAT))
+  out.write(b"MTrk"); pos_length = out.tell(); out.write(pack(">I", 0))
+  n_bytes = 0
+  def event(dt, data):
+    nonlocal n_bytes
+    if dt < 0: raise ValueError(f"subtitles overlap or go back by {-dt}ms")
+    chunk = varInt(dt) + data
+    out.write(chunk); n_bytes += len(chunk)
+
+  t0 = 0; n_notes = 0
+  for (start, end, pitch, velocity, lyric) in timeline:
+    t1 = int(start*SEC_MS)
+    t2 = int(end*SEC_MS)
+    if is_lyrics:
+      text = lyric.encode(getdefaultencoding())
+      event(t1-t0, b"\xff\x05" + varInt(len(text)) + text)
+    event(0 if is_lyrics else t1-t0, bytes((0x90, pitch, velocity))) #< note_on/off alternate, running status never applies
+    event(t2-t1, bytes((0x80, pitch, 64)))
+    t0 = t2; n_notes += 1
+  event(0, b"\xff\x2f\x00") #< end_of_track
+
+  out.seek(pos_length); out.write(pack(">I", n_bytes)); out.seek(0, 2)
+  return n_notes
+
+DEFAULT_TEMPO = 500000 #< microseconds per beat, 120 BPM
+
+def mergeTracks(tracks) -> Iterator[Tuple[int, int, "Message"]]:
+  """k-way merge of tracks into (absolute tick, track index, msg), ordered by tick then track, lyrics before other tracks' events of their tick"""
+  def absolute(i_track, track):
+    tick = 0
+    for msg in track:
+      tick += msg.time
+      yield (tick, i_track, msg)
+  return heapq_merge(*(absolute(i, track) for (i, track) in enumerate(tracks)), key=lambda e: (e[0], e[2].type != "lyrics", e[1])) #< order within a track is kept
 
+def transformBack(midi:"MidiFile", is_lyrics:bool, track_ids=None) -> "Timeline":
+  """Timeline of notes in all tracks (only the longest one if SINGLE_TRACK), in one pass over merged events.
+  Ticks are converted to seconds following tempo changes; note_on/note_off are paired per (channel, pitch),
+  so polyphonic notes are fine. Lyrics attach to the next note_on in their track, or else to the next one in any track
+  (for lyrics kept in a track of their own, most recent first); notes without one are dropped in lyrics mode.
+  Notes are given in order of note_off, writeSrt sorts them by start. Track index of each note is appended to track_ids if given.
+  """
+  from ..timeline import Timeline
+  tracks = [max(midi.tracks, key=len)] if SINGLE_TRACK else midi.tracks
+  k_tick = 1.0 / (midi.ticks_per_beat * 1000000) #< seconds = ticks * tempo * k_tick
+  (tick0, sec0, tempo) = (0, 0.0, DEFAULT_TEMPO)
+  active = {} #< (channel, pitch): [(t_on, velocity, lyric)]
+  lyrics = {} #< track: pending lyric, the most recent last
+  out = Timeline()
+  for (tick, i_track, msg) in mergeTracks(tracks):
+    t = sec0 + (tick - tick0) * tempo * k_tick
+    ty = msg.type
+    if ty == "set_tempo": (tick0, sec0, tempo) = (tick, t, msg.tempo)
+    elif ty == "lyrics": lyrics.pop(i_track, None); lyrics[i_track] = msg.text
+    elif ty == "note_on" and msg.velocity != 0:
+      lyric = lyrics.pop(i_track, None) if is_lyrics else None
+      if lyric == None and is_lyrics and len(lyrics) != 0: lyric = lyrics.popitem()[1] #< from another track
+      if lyric != None or not is_lyrics: active.setdefault((msg.channel, msg.note), []).append((t, msg.velocity, lyric))
+    elif ty == "note_off" or ty == "note_on":
+      ons = active.get((msg.channel, msg.note))
+      if not ons: continue
+      (t_on, velocity, lyric) = ons.pop(0)
+      out.append(t_on, t, msg.note, velocity, lyric)
+      if track_ids != None: track_ids.append(i_track)
+  return out
 
-def newPath(f, ext):
-  return f.name.rsplit(".")[0] + f".{ext}"
+def newPath(path, ext, dir_out=None, name=None):
+  """path with extension replaced, placed at relative name in dir_out if given"""
+  if dir_out != None: path = join(dir_out, name or basename(path))
+  return splitext(path)[0] + f".{ext}"
 
-def fromSrtFile(f, is_lyrics):
-  transform(srt_parse(f.read()), is_lyrics).save(newPath(f, "mid"))
+def readSrtStream(f) -> Iterator[Subtitle]:
+  """parse subtitles from text file f one block (until blank line) at a time"""
+  block = []
+  for line in f:
+    if line.strip() != "": block.append(line); continue
+    if len(block) != 0: yield from srt_parse("".join(block))
+    block = []
+  if len(block) != 0: yield from srt_parse("".join(block))
 
-def backMidFile(f, is_lyrics):
-  midi = MidiFile(f.name, charset=getdefaultencoding(), ticks_per_beat=TICKS_PER_BEAT)
-  (notes, k_time) = (cast(MidiTrack, max(midi.tracks, key=len)), SEC_MS) if SINGLE_TRACK else (midi, 1)
+def fromSrtFile(path, is_lyrics, path_out) -> int:
+  if path.lower().endswith(EXT_TIMELINE): #< binary timeline, records are read from the mapping one by one
+    from ..timeline_file import TimelineFile, NO_PITCH
+    with TimelineFile(path) as tf, open(path_out, "wb") as out:
+      rows = ((t1, t2, NOTE_BASE if is_lyrics or pitch == NO_PITCH else pitch, velocity, lyric or "") for (t1, t2, pitch, velocity, lyric) in tf)
+      return transformStream(rows, is_lyrics, out)
+  with open(path, "r") as f, open(path_out, "wb") as out: return transformStream(srtRows(readSrtStream(f), is_lyrics), is_lyrics, out)
 
-  text_srt = srt_compose(transformBack(iter(notes), is_lyrics, float(k_time)))
-  with open(newPath(f, "srt"), "w+") as srtf: srtf.write(text_srt)
+def backMidFile(path, is_lyrics, path_out) -> int:
+  from mido import MidiFile
+  timeline = transformBack(MidiFile(path, charset=getdefaultencoding()), is_lyrics)
+  with open(path_out, "w+") as srtf: timeline.writeSrt(srtf)
+  return len(timeline)
 
 def midiNotes(path): #< merged from old midnotes.py
-  for i, track in enumerate(MidiFile(path).tracks):
-    msgs = [track[index] for index in range(0, len(track), 2)] #note-on -- note-off
-    for msg in msgs:
-      note = msg.dict().get("note")
-      if note != None: yield note
-
-modes = {
-  "from": lambda f: fromSrtFile(f, False),
-  "from-lyrics": lambda f: fromSrtFile(f, True),
-  "back": lambda f: backMidFile(f, False),
-  "back-lyrics": lambda f: backMidFile(f, True),
-  "print-notes": lambda f: print(list(midiNotes(f.name)))
+  for (_, _, _, pitch, _) in scanNotes(path): yield pitch
+
+def printNotes(notes, out=stdout) -> int:
+  """print(list(notes)) without building the list"""
+  out.write("[")
+  n = 0
+  for (i, note) in enumerate(notes): out.write(f", {note}" if i != 0 else str(note)); n += 1
+  out.write("]\n")
+  return n
+
+EXTS_SRT, EXTS_MIDI = (".srt", EXT_TIMELINE), (".mid", ".midi")
+modes = { # name: (input extensions, output extension, (path, path_out, out) -> n_notes)
+  "from": (EXTS_SRT, "mid", lambda path, path_out, _: fromSrtFile(path, False, path_out)),
+  "from-lyrics": (EXTS_SRT, "mid", lambda path, path_out, _: fromSrtFile(path, True, path_out)),
+  "back": (EXTS_MIDI, "srt", lambda path, path_out, _: backMidFile(path, False, path_out)),
+  "back-lyrics": (EXTS_MIDI, "srt", lambda path, path_out, _: backMidFile(path, True, path_out)),
+  "print-notes": (EXTS_MIDI, None, lambda path, _, out: printNotes(midiNotes(path), out))
 }
 
-from sys import argv
+def collectPaths(args, exts) -> Iterator[Tuple[str, str]]:
+  """(path, name relative to its argument) for files, globs and directories (recursively, filtered by exts)"""
+  for arg in args:
+    paths = sorted(glob(arg, recursive=True)) if has_magic(arg) else [arg]
+    for path in paths:
+      if not isdir(path): yield (path, basename(path)); continue
+      for (root, dirs, files) in walk(path):
+        dirs.sort()
+        for name in sorted(files):
+          if name.lower().endswith(exts): yield (join(root, name), relpath(join(root, name), path))
+
+def outputCollisions(jobs) -> Iterator[Tuple[str, str, str]]:
+  """(path_out, path, other path) for jobs writing the same output file"""
+  seen = {}
+  for (mname, path, name, dir_out) in jobs:
+    ext = modes[mname][1]
+    if ext == None: continue
+    path_out = newPath(path, ext, dir_out, name)
+    if path_out in seen: yield (path_out, seen[path_out], path)
+    else: seen[path_out] = path
+
+def fileStat(path) -> Optional[Tuple[int, int]]:
+  """(mtime, size) of file at path, None if there's none"""
+  if not isfile(path): return None
+  st = stat(path)
+  return (st.st_mtime_ns, st.st_size)
+
+def runJob(job) -> Tuple[str, int, Optional[str], Optional[str]]:
+  """convert one file, errors are reported instead of raised: (path, n_notes, printed text, error).
+  Text is kept until the job is done, so failed jobs print nothing with or without -j"""
+  (mname, path, name, dir_out) = job
+  (_, ext, mode) = modes[mname]
+  buf = StringIO()
+  path_out = None; st0 = None
+  try:
+    if ext != None:
+      path_out = newPath(path, ext, dir_out, name)
+      if dir_out != None: makedirs(dirname(path_out) or ".", exist_ok=True)
+      st0 = fileStat(path_out)
+    n = mode(path, path_out, buf)
+    return (path, n, buf.getvalue(), None)
+  except Exception as ex:
+    if path_out != None and fileStat(path_out) not in (None, st0): remove(path_out) #< no half-written output, untouched files are kept
+    return (path, 0, None, f"{type(ex).__name__}: {ex}")
+
+app = ArgumentParser(prog="srt2mid", usage="srt2mid [mode] [-j N] [-o dir] paths...", description="convert between SRT and MIDI files",
+  epilog=f"modes: {'/'.join(modes.keys())}, default is from")
+app.add_argument("-j", type=int, default=1, help="worker processes")
+app.add_argument("-o", type=str, default=None, help="output directory (default is next to input)")
+app.add_argument("paths", nargs="+", help="files, directories or globs")
+
 def main(args = argv[1:]):
   if len(args) < 1:
-    print(f"Usage: srt2mid [ {'/'.join(modes.keys())} ] files...")
+    print(f"Usage: srt2mid [ {'/'.join(modes.keys())} ] [-j N] [-o dir] files...")
     return
-  mname = args[0]
-  (mode, paths) = (modes["from"], args[0:]) if mname not in modes else (modes[mname], args[1:])
-  for path in paths:
-    with open(path, "r") as ins: mode(ins)
+  (mname, args) = ("from", args) if args[0] not in modes else (args[0], args[1:])
+  cfg = app.parse_args(args)
+  jobs = [(mname, path, name, cfg.o) for (path, name) in collectPaths(cfg.paths, modes[mname][0])]
+  for (path_out, path, other) in outputCollisions(jobs):
+    app.error(f"{path} and {other} would both be written to {path_out}, convert them separately")
+
+  t0 = time()
+  if cfg.j <= 1: results = map(runJob, jobs)
+  else:
+    from multiprocessing import Pool
+    pool = Pool(cfg.j)
+    results = pool.imap(runJob, jobs) #< ordered, so printed notes match serial output
+  n_files = n_notes = n_failed = 0
+  for (path, n, text, error) in results:
+    if text != None: stdout.write(text)
+    if error != None: print(f"{path}: {error}", file=stderr); n_failed += 1
+    n_files += 1; n_notes += n
+  if cfg.j > 1: pool.close(); pool.join()
+  dt = max(time() - t0, 1e-9)
+  if n_files > 1 or n_failed != 0:
+    print(f"{n_files} files ({n_failed} failed), {n_notes} notes in {dt:.2f}s: {n_files/dt:.1f} files/s, {n_notes/dt:.0f} notes/s", file=stderr)
+  if n_failed != 0: exit(1)
 
 if __name__ == "__main__": main()
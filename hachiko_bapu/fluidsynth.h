@@ -9,6 +9,11 @@ int fluid_settings_setnum(void* settings, char* name, double val);
 
 int fluid_settings_setint(void* settings, char* name, int val);
 
+int fluid_settings_getint(void* settings, char* name, void* val);
+int fluid_settings_getnum(void* settings, char* name, void* val);
+int fluid_settings_copystr(void* settings, char* name, void* str, int len);
+int fluid_settings_getint_range(void* settings, char* name, void* min, void* max);
+
 int fluid_synth_sfload(void* synth, char* filename, int update_midi_presets);
 int fluid_synth_sfunload(void* synth, int sfid, int update_midi_presets);
 
@@ -16,8 +21,28 @@ int fluid_synth_program_select(void* synth, int chan, int sfid, int bank, int pr
 
 int fluid_synth_noteon(void* synth, int chan, int key, int vel);
 int fluid_synth_noteoff(void* synth, int chan, int key);
+int fluid_synth_cc(void* synth, int chan, int num, int val);
+int fluid_synth_pitch_bend(void* synth, int chan, int val);
 
 void fluid_synth_write_s16(void* synth, int len, void* lbuf, int loff, int lincr, void* rbuf, int roff, int rincl);
+int fluid_synth_write_float(void* synth, int len, void* lout, int loff, int lincr, void* rout, int roff, int rincr);
+int fluid_synth_process(void* synth, int len, int nfx, void* fx, int nout, void* out);
+
+void* new_fluid_sequencer2(int use_system_timer);
+void delete_fluid_sequencer(void* seq);
+short fluid_sequencer_register_fluidsynth(void* seq, void* synth);
+void fluid_sequencer_unregister_client(void* seq, short id);
+int fluid_sequencer_get_tick(void* seq);
+void fluid_sequencer_set_time_scale(void* seq, double scale);
+int fluid_sequencer_send_at(void* seq, void* evt, int time, int absolute);
+void fluid_sequencer_process(void* seq, int msec);
+
+void* new_fluid_event();
+void delete_fluid_event(void* evt);
+void fluid_event_set_source(void* evt, short src);
+void fluid_event_set_dest(void* evt, short dest);
+void fluid_event_noteon(void* evt, int channel, short key, short vel);
+void fluid_event_noteoff(void* evt, int channel, short key);
 
 void* new_fluid_audio_driver(void* settings, void* synth);
 
@@ -39,10 +39,18 @@ def findLibrary(name, lib_names, solver=lambda name: [f"./{name}.dll"]) -> str:
   if path == None: raise ImportError(f"couldn't find the {name} library")
   else: return takePipeIf(isfile, abspath, str(path)) #< only if found file, not libname in PATH
 
-def createLibrary(path, mode = 1):
+def createLibrary(path, mode = 1, fast = False):
+  """cfunc(name, t_result, *(arg_name, t_arg)) binds a C function of library at path.
+  fast gives the plain CDLL function with argtypes/restype (positional args only),
+  otherwise a prototype with paramflags (args also by name, but slower per call)
+  """
   lib = CDLL(path)
   def cfunc(name, t_result, *args):
     t_args = tuple(arg[1] for arg in args)
+    if fast:
+      f = getattr(lib, name)
+      f.restype, f.argtypes = t_result, t_args
+      return f
     extras = tuple((mode, arg[0]) for arg in args)
     return CFUNCTYPE(t_result, *t_args)((name, lib), extras)
   return cfunc
@@ -66,7 +74,7 @@ if __name__ == "__main__":
 
 ctype = {
   "void": "None", "void*": "c_void_p", "char*": "c_char_p",
-  "int": "c_int", "double": "c_double"
+  "int": "c_int", "short": "c_short", "float": "c_float", "double": "c_double"
 }.__getitem__
 def post_cdecl(m):
   """t_result fname(type name, ...args);"""
@@ -80,7 +88,7 @@ from os.path import isfile
 
 def isInsideModule(): return isfile("__init__.py")
 
-def codegen(path_dst, path_header, name, lib_names):
+def codegen(path_dst, path_header, name, lib_names, fast=False):
   output = open(path_dst, "w+", encoding="utf-8")
   def line(text = ""): output.write(text); output.write("\n")
 
@@ -92,7 +100,7 @@ def codegen(path_dst, path_header, name, lib_names):
   def libdefs():
     line(f"lib_names = {repr(lib_names)}")
     line(f"lib_path = findLibrary({repr(name)}, lib_names)")
-    line(f"cfunc = createLibrary(lib_path)")
+    line("cfunc = createLibrary(lib_path, fast=True)" if fast else "cfunc = createLibrary(lib_path)")
   def cimport(decls):
     type_refs = flatMap(lambda it: [it[1]] + [arg[1] for arg in it[2]], decls)
     imports = set(filter(lambda it: it.startswith("c_"), type_refs))
@@ -115,10 +123,12 @@ def codegen(path_dst, path_header, name, lib_names):
   output.close()
 
 def main(argv = argv):
-  if len(argv) < 4:
-    print(f"Usage: {argv[0]} header name lib_names")
+  fast = "--fast" in argv #< plain CDLL functions, no paramflags
+  args = [arg for arg in argv if arg != "--fast"]
+  if len(args) < 4:
+    print(f"Usage: {argv[0]} [--fast] header name lib_names")
     return
-  header, name = argv[1:3]
-  codegen(f"{name}.py", header, name, argv[3:])
+  header, name = args[1:3]
+  codegen(f"{name}.py", header, name, args[3:], fast)
 
 if __name__ == '__main__': main()
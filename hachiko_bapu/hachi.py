@@ -5,20 +5,20 @@ from typing import Any, Callable, Optional, TypeVar, Generic
 A = TypeVar("A"); T = TypeVar("T")
 
 from argparse import ArgumentParser, FileType
-from time import time
-from datetime import timedelta
+from io import StringIO, BytesIO
+from time import perf_counter, perf_counter_ns
+from functools import lru_cache
+from collections import deque
 
-from srt import Subtitle, compose
 from json import loads, dumps, JSONDecodeError
 
 from os import environ, system #v disable prompt
+from os.path import dirname, join
 environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
-import pygame
 
 from .hachitools import *
-from .synthesize import NoteSynth
-from pkg_resources import resource_filename
 from .funutils import let
+pygame = lazyImport("pygame") #< pygame, FluidSynth and timeline (numpy) are loaded on first use, "hachiko -h" needs none
 
 def splitAs(type, transform = int, delim = ","):
   return lambda it: type(transform(s) for s in it.split(delim))
@@ -35,9 +35,22 @@ askMethod = env("ASK_METHOD", str, "tk")
 playDuration = env("PLAY_DURATION", splitAs(list, transform=float), [0.3, 0.5, 1.5])
 cmdOnDone = env("HACHIKO_DONE", str, "srt2mid out")
 
-INSTRUMENT_SF2 = env("SFONT", str, resource_filename(__name__, "instrument.sf2"))
+INSTRUMENT_SF2 = env("SFONT", str, join(dirname(__file__), "instrument.sf2"))
 sampleRate = env("SAMPLE_RATE", int, 44100)
-synth = NoteSynth(sampleRate) #< used twice
+latencyProfile = env("LATENCY_PROFILE", str, "balanced")
+LATENCY_PROFILE_NAMES = list(LATENCY_PROFILES)
+def newSynth():
+  from .synthesize import NoteSynth
+  return NoteSynth(sampleRate, profile=latencyProfile)
+synth = Lazy(newSynth) #< used twice
+
+def newReplaySynth():
+  from .synthesize import NoteSynth
+  replay = NoteSynth(sampleRate, profile="balanced") #< offline, never opens audio driver
+  if synth.font != None: calmSetSFont(replay, *synth.font)
+  return replay
+replaySynth = Lazy(newReplaySynth)
+replaying = None #< Sound being played, kept referenced
 
 bgmVolume = env("BGM_VOLUME", float, None)
 bgmSpeed = env("BGM_SPEED", float, None) #TODO
@@ -72,13 +85,15 @@ def blockingAskThen(onDone:Callable[[T], Any], name:str, transform:Callable[[str
 
 app = ArgumentParser(prog="hachi", description="Simple tool for creating pitch timeline",
     epilog="In pitch window, [0-9] select pitch; [Enter] add; [Backspace] remove last\n"+
-      f"Useful env-vars: SAMPLE_RATE, BGM_VOLUME, SFONT (sf2 path), ASK_METHOD (tk/input); pygame {pygame.ver}")
+      "Useful env-vars: SAMPLE_RATE, BGM_VOLUME, SFONT (sf2 path), ASK_METHOD (tk/input), LATENCY_PROFILE")
 app.add_argument("-note-base", type=int, default=45, help="pitch base number")
 app.add_argument("-note-preset", type=int, default=0, help=f"SoundFont ({INSTRUMENT_SF2}) preset index, count from 0")
-app.add_argument("-seq", type=str, default=None, help="sequence given in pitch editor window")
+app.add_argument("-seq", type=str, default=None, help=f"sequence given in pitch editor window (JSON list, or a {EXT_TIMELINE} file to take pitches/lyrics from)")
 app.add_argument("-play", type=FileType("r"), default=None, help="music file used for playing")
 app.add_argument("-play-seek", type=float, default=0.0, help="initial seek for player")
-app.add_argument("-o", type=str, default="puzi.srt", help="output subtitle file path (default puzi.srt, can be - for stdout)")
+app.add_argument("-latency", type=str, choices=LATENCY_PROFILE_NAMES, default=latencyProfile, help=f"audio buffer profile (default {latencyProfile}, env LATENCY_PROFILE), check with hachiko-probe")
+app.add_argument("-measure-loop", action="store_true", default=False, help="print CPU usage, event dispatch latency and redraw times of GUI loops, audition latency and playback timing")
+app.add_argument("-o", type=str, default="puzi.srt", help=f"output subtitle file path (default puzi.srt, can be - for stdout), binary timeline if it ends with {EXT_TIMELINE}")
 
 class ActionHandler(Generic[A, T]):
   def actions(self, ctx:A, key:T): pass
@@ -90,7 +105,10 @@ class RecordKeys(AsList, ActionHandler[RefUpdate, str]):
       rm = self.items.pop()
       ctx.show(f"!~{rm} #{len(self.items)}")
     elif key == 'r':
-      play = lambda n: ctx.slides(playDuration[1], *map(lambda i: f"!{i}", self.items[-n:]), "!done")
+      def play(n):
+        items = self.items[-n:]
+        replayPitches(items, playDuration[1])
+        ctx.slides(playDuration[1], *map(lambda i: dumpOctave(i) if isinstance(i, int) else str(i), items), "done") #< display only
       try: blockingAskThen(play, "n", int, str(len(self.items)))
       except ValueError: ctx.show("Invalid Count")
     elif key == 'k':
@@ -100,58 +118,151 @@ class RecordKeys(AsList, ActionHandler[RefUpdate, str]):
       try: blockingAskThen(save, "list", loads, dumps(self.items))
       except JSONDecodeError: ctx.show("Load Failed")
 
-class AsSrt(AsList):
+class AsSrt(Fold[tuple, str]):
+  """(t1, t2, pitch or lyric) items into a Timeline (and its interval index), finished as SRT text"""
+  def __init__(self):
+    from .timeline import Timeline
+    from .interval_index import IntervalIndex
+    self.timeline = Timeline(); self.index = IntervalIndex()
+  def accept(self, value):
+    (t1, t2, item) = value
+    self.index.insert(t1, t2, len(self.timeline))
+    if isinstance(item, int): self.timeline.append(t1, t2, item)
+    else:
+      from .timeline import NO_PITCH
+      self.timeline.append(t1, t2, NO_PITCH, lyric=str(item))
+  def dump(self, out) -> int:
+    """write items as SRT (same as srt.compose) to text file out"""
+    return self.timeline.writeSrt(out)
   def finish(self):
-    td = lambda s: timedelta(seconds=s)
-    return compose([Subtitle(i+1, td(p[0]), td(p[1]), str(p[2])) for (i, p) in enumerate(self.items)])
+    buf = StringIO(); self.dump(buf)
+    return buf.getvalue()
 
 from sys import argv, stdout, stderr
 def main(args = argv[1:]):
   cfg = app.parse_args(args)
-  global synth; calmSetSFont(synth, INSTRUMENT_SF2, cfg.note_preset); synth.start()
+  global synth, latencyProfile; latencyProfile = cfg.latency #< before synth is created
+  calmSetSFont(synth, INSTRUMENT_SF2, cfg.note_preset); synth.start()
   pygame.mixer.init(sampleRate)
   pygame.init()
   rkeys = RecordKeys()
-  pitches = loads(cfg.seq) if cfg.seq != None else guiReadPitches(cfg.note_base, rkeys, onKey=rkeys.actions)
-  srt = guiReadTimeline(iter(pitches), AsSrt(), play=cfg.play, play_seek=cfg.play_seek)
-
-  if cfg.o == NAME_STDOUT: stdout.write(srt)
+  if cfg.seq != None and cfg.seq.lower().endswith(EXT_TIMELINE):
+    from .timeline_file import TimelineFile
+    with TimelineFile(cfg.seq) as tf: pitches = [lyric if lyric != None else pitch for (_, _, pitch, _, lyric) in tf]
+  else: pitches = loads(cfg.seq) if cfg.seq != None else guiReadPitches(cfg.note_base, rkeys, onKey=rkeys.actions, measure=cfg.measure_loop)
+  timeline = AsSrt()
+  guiReadTimeline(iter(pitches), timeline, play=cfg.play, play_seek=cfg.play_seek, measure=cfg.measure_loop)
+
+  if cfg.o == NAME_STDOUT: timeline.dump(stdout)
+  elif cfg.o.lower().endswith(EXT_TIMELINE):
+    from .timeline_file import writeTimelineFile
+    with open(cfg.o, "wb") as f: writeTimelineFile(f, timeline.timeline)
   else:
-    with open(cfg.o, "w+", encoding="utf-8") as srtf: srtf.write(srt)
+    with open(cfg.o, "w+", encoding="utf-8") as srtf: timeline.dump(srtf)
   system(cmdOnDone.replace("out", cfg.o))
 
 
 def gameWindow(caption, dimen):
+  global last_drawn
   pygame.display.set_caption(caption)
   pygame.display.set_mode(dimen)
+  last_drawn = (None, None, None) #< pygame 2 may give the same surface again, it's drawn from scratch anyway
+
+@lru_cache(maxsize=1)
+def gameFont(name, size):
+  return pygame.font.SysFont(name, size) #< resolving system fonts is slow, only done once
+
+@lru_cache(maxsize=env("TEXT_CACHE", int, 64))
+def renderText(text, fg, bg):
+  return gameFont(fontName, fontSize).render(text, True, fg, bg) #< opaque, blits without blending
+
+frameTimes = deque(maxlen=1000) #< seconds spent in each gameCenterText redraw
+last_drawn = (None, None, None) #< (surface, text, rect) on screen
 
 def gameCenterText(text, cx=0.5, cy=0.5):
+  """draw text centered in window, only updating the part that changed"""
+  global last_drawn
+  t0 = perf_counter()
   bg = pygame.display.get_surface()
-  bg.fill(backgroundColor)
-
-  font = pygame.font.SysFont(fontName, fontSize)
-  rtext = font.render(text, 1, textColor)
+  (last_bg, last_text, last_rect) = last_drawn
+  rtext = renderText(text, textColor, backgroundColor)
   textpos = rtext.get_rect(centerx=bg.get_width()*cx, centery=bg.get_height()*cy)
-  bg.blit(rtext, textpos)
-  pygame.display.flip()
-
-def mainloopCall(handler):
-  for event in pygame.event.get(): handler(event)
+  if bg is not last_bg: #< new window (see gameWindow), draw all
+    bg.fill(backgroundColor); bg.blit(rtext, textpos)
+    pygame.display.flip()
+  elif text != last_text or textpos != last_rect:
+    bg.fill(backgroundColor, last_rect); bg.blit(rtext, textpos)
+    pygame.display.update([last_rect, textpos])
+  last_drawn = (bg, text, textpos)
+  frameTimes.append(perf_counter() - t0)
+
+def frameReport() -> str:
+  (f50, f95, f99) = percentiles(list(frameTimes))
+  return f"{len(frameTimes)} redraws, p50 {f50*SEC_MS:.2f}ms p95 {f95*SEC_MS:.2f}ms p99 {f99*SEC_MS:.2f}ms ({renderText.cache_info().hits} cached texts)"
+
+N_WAIT_IDLE = 250 #< ms, upper bound of a blocked wait; timers and RefUpdate.show wake the loop with EVENT_UPDATE
+N_WAIT_AUDIO = 10 #< ms, while recording, to follow BGM position
+
+def userEvent(k:int) -> int: return pygame.USEREVENT + k
+EVENT_UPDATE, EVENT_PROBE = 1, 2
+ns_events = 0 #< perf_counter_ns() when events in hand were taken from the queue
+
+def waitEvents(n_ms:int):
+  """block until events come or n_ms passed, then take all queued ones"""
+  try: event = pygame.event.wait(n_ms)
+  except TypeError: #< pygame 1 waits without timeout, sleep a bit instead
+    pygame.time.wait(min(n_ms, 10)); return pygame.event.get()
+  return ([event] if event.type != pygame.NOEVENT else []) + pygame.event.get()
+
+def mainloopCall(handler, clock:Optional[TimingEngine]=None, n_wait:Optional[int]=None, meter:Optional[LoopMeter]=None):
+  """handle queued events, blocking up to n_wait ms for them when given (instead of spinning)"""
+  global ns_events
+  t0 = perf_counter()
+  events = pygame.event.get() if n_wait == None else waitEvents(n_wait)
+  ns_events = perf_counter_ns()
+  if clock != None: clock.poll(perf_counter() - t0) #< stamp right after they are taken, before any handler runs
+  for event in events:
+    if event.type == userEvent(EVENT_UPDATE): continue #< just woke the loop up
+    elif event.type == userEvent(EVENT_PROBE):
+      if meter != None: meter.onProbe(event.stamp)
+    else: handler(event)
+
+def newLoopMeter(measure:bool) -> Optional[LoopMeter]:
+  if not measure: return None
+  meter = LoopMeter(lambda stamp: pygame.event.post(pygame.event.Event(userEvent(EVENT_PROBE), stamp=stamp)))
+  meter.start()
+  return meter
+
+def replayPitches(items, n_sec:float):
+  """play items (n_sec each, after n_sec like slides; lyrics are rests) rendered by a Sequencer into one Sound,
+  so notes keep sample-exact timing instead of following timers"""
+  global replaying
+  from .synthesize import Sequencer
+  from .render import openPcm
+  notes = [((i+1)*n_sec, (i+2)*n_sec, pitch) for (i, pitch) in enumerate(items) if isinstance(pitch, int)]
+  wav = BytesIO()
+  replaySynth.reset() #< nothing of last replay sounds in this one
+  with openPcm(wav, sampleRate) as out: Sequencer(replaySynth.value, notes).render(out)
+  wav.seek(0)
+  replaying = pygame.mixer.Sound(wav) #< from WAV, converted to mixer format
+  replaying.play()
 
 def calmSetSFont(synth, path, preset):
   try: synth.setFont(path, preset)
   except OSError: print(f"{path} is required to enable note playback!", file=stderr)
 
-def guiReadPitches(note_base:int, reducer, onKey = lambda ctx, k: (), caption = "Add Pitches"):
+def guiReadPitches(note_base:int, reducer, onKey = lambda ctx, k: (), caption = "Add Pitches", measure = False):
   gameWindow(caption, WINDOW_DIMEN)
+  meter = newLoopMeter(measure)
 
   def playSec(n_sec, pitch):
-    synth.noteSwitch(pitch)
-    timeout(n_sec, synth.noteoff)
+    synth.switch(pitch)
+    timeout(n_sec, synth.release, key="playSec") #< a newer note replaces pending release, so it isn't cut short
 
   playSec(playDuration[1], note_base)
 
   ctx = RefUpdate("Ready~!")
+  ctx.on_update = lambda: pygame.event.post(pygame.event.Event(userEvent(EVENT_UPDATE))) #< thread-safe
   intro = ctx.slides(playDuration[2], f"0={dumpOctave(note_base)}", "[P] proceed",
       "[-=] slide pitch", "[R]replay [K]list", "Have Fun!")
 
@@ -179,11 +290,11 @@ def guiReadPitches(note_base:int, reducer, onKey = lambda ctx, k: (), caption =
       if notNumber(): return
       else:
         pitch = getNumber()
-        synth.noteon(pitch)
+        synth.audition(pitch, ns_events) #< own pool voice, overlapping keys don't cut each other
         ctx.show(dumpOctave(pitch))
     elif event.type == pygame.KEYUP:
       if notNumber(): defaultOnKey(chr(event.key))
-      else: synth.noteoff(getNumber())
+      else: synth.release(getNumber())
     elif event.type == pygame.QUIT:
       raise SystemExit()
 
@@ -192,51 +303,43 @@ def guiReadPitches(note_base:int, reducer, onKey = lambda ctx, k: (), caption =
       text = ctx.item
       if len(text) != 0 and text[0] == '!':
         cmd = text[1:]
-        if cmd == "done": synth.noteoff()
+        if cmd == "done": synth.release()
         elif cmd.startswith("~"): playSec(playDuration[0], int(cmd[1:].rsplit("#")[0]))
-        else: synth.noteSwitch(int(cmd))
+        else: synth.switch(int(cmd))
       gameCenterText(text)
 
-    try: mainloopCall(onEvent)
+    try: mainloopCall(onEvent, n_wait=N_WAIT_IDLE, meter=meter)
     except NonlocalReturn as exc:
       if exc.value == "proceed": break
+  synth.silence()
+  if meter != None: print("audition:", synth.auditionReport(), "\npitches loop:", meter.stop(), "\nframes:", frameReport(), "\nscheduler:", scheduler.report(), file=stderr)
   return reducer.finish()
 
-class SwitchCallTimed(SwitchCall): #< time record (op -- op1)*
-  def __init__(self, op, op1):
-    super().__init__(op, op1)
-    self.t0 = time()
-  def __call__(self):
-    if self.flag:
-      return super().__call__()
-    else: #v resuming
-      super().__call__()
-      t0 = self.t0
-      t1 = time()
-      self.t0 = t1
-      return t1 - t0
-
-def guiReadTimeline(pitchz, reducer, play = None, play_seek = 0.0, caption = "Add Timeline", d_seek = 5.0, d_volume = 0.1, note_base = 45):
-  mus = pygame.mixer_music; mus_t0 = time()
+def guiReadTimeline(pitchz, reducer, play = None, play_seek = 0.0, caption = "Add Timeline", d_seek = 5.0, d_volume = 0.1, note_base = 45, measure = False):
+  mus = pygame.mixer_music; seek_base = 0.0
   gameWindow(caption, WINDOW_DIMEN)
+  meter = newLoopMeter(measure)
   if play != None:
     mus.load(play)
     let(mus.set_volume, bgmVolume)
     mus.play()
+  def audioPos():
+    ms = mus.get_pos() #< played time, pygame mixer_music.get_pos does not follow set_pos
+    return seek_base + ms/SEC_MS if ms != (-1) else None
+  clock = TimingEngine(audioPos if play != None else None) #< timeline follows BGM position
 
-  onPausePlay = SwitchCallTimed(mus.unpause, mus.pause)
   gameCenterText("[A]keep [S]split")
-  t0 = time()
   t1 = None
   def seek(dist:float):
-    nonlocal mus_t0, t0
+    nonlocal seek_base
     if mus.get_pos() == (-1): return
-    pos = time() - mus_t0 #< pygame mixer_music.get_pos does not follow set_pos
+    pos = clock.now()
     newpos = pos+dist
-    print("+@", pos, newpos, file=stderr)
+    index = getattr(reducer, "index", None) #< timeline jumps by dist too, over notes recorded before a replay
+    print("+@", pos, newpos, f"(skips {len(index.overlapping(pos, newpos))} recorded notes)" if index != None else "", file=stderr)
     mus.set_pos(newpos)
-    mus_t0 -= dist
-    t0 -= dist
+    seek_base += dist
+    clock.shift(dist)
   seek(play_seek)
 
   last_item = None #< function could be rewritten in two variants
@@ -253,12 +356,12 @@ def guiReadTimeline(pitchz, reducer, play = None, play_seek = 0.0, caption = "Ad
       gameCenterText(str(pitch))
   def giveSegment():
     nonlocal t1
-    t2 = time()
-    reducer.accept( (t1-t0, t2-t0, last_item or synth.last_pitch) )
+    t2 = clock.stamp()
+    reducer.accept( (t1, t2, last_item or synth.last_pitch) )
     t1 = t2 #< new start
 
   def onEvent(event):
-    nonlocal t0, t1
+    nonlocal t1
     evt = event.type
     isKdown = (evt == pygame.KEYDOWN)
     def actButton(): return ('a' if event.button == 1 else 's')
@@ -266,7 +369,7 @@ def guiReadTimeline(pitchz, reducer, play = None, play_seek = 0.0, caption = "Ad
       key = chr(event.key) if isKdown else actButton()
       if key == 's': giveSegment(); splitNote()
       elif key == 'a':
-        t1 = time()
+        t1 = clock.stamp()
         splitNote()
     elif evt == pygame.KEYUP or evt == pygame.MOUSEBUTTONUP:
       key = chr(event.key) if evt==pygame.KEYUP else actButton()
@@ -274,8 +377,8 @@ def guiReadTimeline(pitchz, reducer, play = None, play_seek = 0.0, caption = "Ad
         synth.noteoff()
         giveSegment()
       elif key == ' ':
-        t = onPausePlay()
-        if t != None: t0 += t
+        if clock.paused: mus.unpause(); clock.resume()
+        else: mus.pause(); clock.pause()
       elif key == 'ē': # Arrow-Right
         seek(d_seek)
       elif key == '-': # volume down
@@ -285,9 +388,10 @@ def guiReadTimeline(pitchz, reducer, play = None, play_seek = 0.0, caption = "Ad
 
     elif evt == pygame.QUIT: raise SystemExit()
   while True:
-    try: mainloopCall(onEvent)
+    try: mainloopCall(onEvent, clock, N_WAIT_AUDIO if play != None else N_WAIT_IDLE, meter)
     except NonlocalReturn: break
   synth.noteoff()
+  if meter != None: print("timing:", clock.report(), "\ntimeline loop:", meter.stop(), "\nframes:", frameReport(), "\nscheduler:", scheduler.report(), file=stderr)
   return reducer.finish()
 
 if __name__ == "__main__": main()
@@ -1,10 +1,25 @@
 from typing import Any, Callable, Optional, List, TypeVar, Generic
 T = TypeVar("T"); R = TypeVar("R")
 
-from threading import Timer
-from os import environ
+from threading import Condition, Thread
+from heapq import heappush, heappop, heapify
+from itertools import count
+from collections import deque
+from traceback import print_exc
+from time import perf_counter, perf_counter_ns, process_time, sleep
+from random import random
+from os import environ, cpu_count
+from importlib import import_module
 
 SEC_MS = 1000
+EXT_TIMELINE = ".hkt" #< binary timeline file (timeline_file), named here so CLIs can mention it without loading numpy
+DEFAULT_VELOCITY = 64 #< of timeline notes, as MIDI note_on
+
+LATENCY_PROFILES = { #< audio buffers (period-size * periods frames) and voice rendering, applied before synth creation (see synthesize.Synth), kept here so CLIs list them without loading FluidSynth
+  "live": {"audio.period-size": 128, "audio.periods": 2, "synth.cpu-cores": 1, "synth.polyphony": 64}, #< ~6ms, no thread handoff per block
+  "balanced": {"audio.period-size": 256, "audio.periods": 4, "synth.cpu-cores": 2, "synth.polyphony": 128}, #< ~23ms like library defaults
+  "render": {"audio.period-size": 1024, "audio.periods": 8, "synth.cpu-cores": min(cpu_count() or 1, 16), "synth.polyphony": 256}
+}
 
 def htmlColor(c:str): return tuple(int(c[i-1:i+1], 16) for i in range(1, len(c), 2))
 def grayColor(n:int): return (n,n,n)
@@ -12,9 +27,94 @@ def grayColor(n:int): return (n,n,n)
 def env(name:str, transform:Callable[[str],T], default:T) -> T:
   return transform(environ[name]) if name in environ else default
 
-def timeout(n_sec:float, op):
-  timer = Timer(n_sec, op); timer.start()
-  return timer
+class Scheduled:
+  """handle of an action in Scheduler, like threading.Timer it can be cancelled before it runs"""
+  __slots__ = ("due", "op", "key", "state")
+  PENDING, FIRED, CANCELLED = 0, 1, 2
+  def __init__(self, due:float, op, key):
+    self.due, self.op, self.key = due, op, key; self.state = Scheduled.PENDING
+  def cancel(self) -> bool:
+    """True if it won't run (now or already), False if it has run"""
+    return scheduler.cancel(self)
+  @property
+  def pending(self) -> bool: return self.state == Scheduled.PENDING
+
+class Scheduler:
+  """Runs delayed actions on one daemon thread, ordered by due time in a heap.
+  Scheduling with a key cancels the pending action of same key (coalescing, latest wins);
+  at most n_max actions are pending, more raise RuntimeError.
+  """
+  def __init__(self, n_max=1024):
+    self.n_max = n_max
+    self.heap = []; self.seq = count(); self.keys = {}; self.n_pending = 0
+    self.cond = Condition(); self.thread:Optional[Thread] = None
+    self.n_scheduled = self.n_fired = self.n_cancelled = self.n_coalesced = 0
+    self.lateness = deque(maxlen=1000) #< seconds each fired action ran after its due time
+
+  def schedule(self, n_sec:float, op:Callable[[], Any], key=None) -> Scheduled:
+    with self.cond:
+      if key != None and key in self.keys:
+        self._cancel(self.keys[key]); self.n_coalesced += 1
+      if self.n_pending >= self.n_max: raise RuntimeError(f"scheduler queue is full ({self.n_max} pending)")
+      item = Scheduled(perf_counter() + n_sec, op, key)
+      heappush(self.heap, (item.due, next(self.seq), item)); self.n_pending += 1; self.n_scheduled += 1
+      if key != None: self.keys[key] = item
+      if self.thread == None: self.thread = Thread(target=self._run, name="hachitools.Scheduler", daemon=True); self.thread.start()
+      if self.heap[0][2] is item: self.cond.notify() #< new earliest
+      return item
+  def _cancel(self, item:Scheduled) -> bool:
+    if item.state != Scheduled.PENDING: return item.state == Scheduled.CANCELLED
+    item.state = Scheduled.CANCELLED; self.n_pending -= 1; self.n_cancelled += 1
+    if self.keys.get(item.key) is item: del self.keys[item.key]
+    if len(self.heap) > 64 and len(self.heap) > 2*self.n_pending: #< drop cancelled entries, they're skipped lazily otherwise
+      self.heap = [e for e in self.heap if e[2].state == Scheduled.PENDING]; heapify(self.heap)
+    return True
+  def cancel(self, item:Scheduled) -> bool:
+    with self.cond: return self._cancel(item)
+
+  def _run(self):
+    while True:
+      with self.cond:
+        while True:
+          while len(self.heap) != 0 and self.heap[0][2].state != Scheduled.PENDING: heappop(self.heap)
+          if len(self.heap) == 0: self.cond.wait(); continue
+          dt = self.heap[0][0] - perf_counter()
+          if dt <= 0: break
+          self.cond.wait(dt)
+        (due, _, item) = heappop(self.heap)
+        item.state = Scheduled.FIRED; self.n_pending -= 1; self.n_fired += 1
+        if self.keys.get(item.key) is item: del self.keys[item.key]
+        self.lateness.append(perf_counter() - due)
+      try: item.op()
+      except Exception: print_exc()
+
+  def stats(self) -> dict:
+    with self.cond: late = list(self.lateness)
+    (l50, l95, l99) = percentiles(late)
+    return {"scheduled": self.n_scheduled, "fired": self.n_fired, "cancelled": self.n_cancelled, "coalesced": self.n_coalesced,
+      "pending": self.n_pending, "lateness_ms": {"p50": l50*SEC_MS, "p95": l95*SEC_MS, "p99": l99*SEC_MS}}
+  def report(self) -> str:
+    st = self.stats(); late = st["lateness_ms"]
+    return (f"{st['scheduled']} scheduled, {st['fired']} fired, {st['cancelled']} cancelled ({st['coalesced']} coalesced), "
+      f"lateness p50 {late['p50']:.2f}ms p95 {late['p95']:.2f}ms p99 {late['p99']:.2f}ms")
+
+scheduler = Scheduler()
+
+def timeout(n_sec:float, op, key=None) -> Scheduled:
+  """run op after n_sec on the scheduler thread; a new timeout with same key replaces the pending one"""
+  return scheduler.schedule(n_sec, op, key)
+
+class Lazy(Generic[T]):
+  """proxy of value created by op on first attribute access, to keep startup cheap"""
+  def __init__(self, op:Callable[[], T]):
+    self._op = op; self._value:Optional[T] = None
+  @property
+  def value(self) -> T:
+    if self._value == None: self._value = self._op()
+    return self._value
+  def __getattr__(self, name): return getattr(self.value, name)
+
+def lazyImport(name:str): return Lazy(lambda: import_module(name))
 
 class NonlocalReturn(Exception):
   def __init__(self, value = None):
@@ -37,6 +137,7 @@ class AsList(Generic[T], Fold[T, List[T]]):
 class RefUpdate(Generic[T]):
   def __init__(self, initial:T):
     self._item = initial; self.last_item:Optional[T] = None
+    self.on_update:Optional[Callable[[], Any]] = None #< called after show (also from timer threads), e.g. to wake event loop
   @property
   def item(self): return self._item
   def _updated(self): self.last_item = self._item
@@ -48,6 +149,7 @@ class RefUpdate(Generic[T]):
   def show(self, item:T):
     self._updated()
     self._item = item
+    if self.on_update != None: self.on_update()
   def slides(self, n_sec, *items:T):
     stream = iter(items)
     def showNext():
@@ -59,6 +161,84 @@ class RefUpdate(Generic[T]):
     timeouts = [timeout(n_sec, showNext)]
     return timeouts
 
+def percentiles(xs:List[float], ps=(50, 95, 99)) -> List[float]:
+  """nearest-rank percentiles of xs (0.0 when empty)"""
+  ys = sorted(xs)
+  return [ys[min(len(ys)-1, len(ys)*p // 100)] if len(ys) != 0 else 0.0 for p in ps]
+
+class TimingEngine:
+  """Timeline clock on perf_counter_ns (monotonic, no wall-clock jumps), stopped while paused.
+  poll() once per event loop round: events are stamped with the time they were taken from the queue,
+  and the time since previous poll not spent blocked in waiting (the most they could have waited unseen) is kept as their jitter.
+  When audio_pos (seconds of playing audio, or None) is given, the clock is continuously slewed toward it by k_correct
+  of each error when it advances, errors above n_reset (e.g. after seek) are applied at once.
+  """
+  def __init__(self, audio_pos:Optional[Callable[[], Optional[float]]]=None, k_correct=0.05, n_reset=0.25):
+    self.audio_pos = audio_pos; self.k_correct, self.n_reset = k_correct, n_reset
+    self.ns0 = perf_counter_ns(); self.offset = 0.0 #< timeline = (ns - ns0)/1e9 + offset
+    self.ns_paused:Optional[int] = None
+    self.ns_poll = self.ns0; self.gap = 0.0; self.t_event = 0.0; self.last_pos = None
+    self.jitters:List[float] = []; self.errors:List[float] = []; self.n_resets = 0
+  def _at(self, ns:int) -> float:
+    return ((self.ns_paused if self.ns_paused != None else ns) - self.ns0) / 1e9 + self.offset
+  def now(self) -> float: return self._at(perf_counter_ns())
+
+  def poll(self, n_blocked=0.0) -> float:
+    """stamp of events taken from the queue just now (after n_blocked seconds of waiting for them, which wakes on arrival),
+    correcting against the audio clock"""
+    ns = perf_counter_ns()
+    self.gap = max(0.0, (ns - self.ns_poll) / 1e9 - n_blocked); self.ns_poll = ns
+    self.t_event = self._at(ns)
+    if self.audio_pos != None and self.ns_paused == None:
+      pos = self.audio_pos()
+      if pos != None and pos != self.last_pos: #< position advances by audio buffers, only fresh ones are compared
+        self.last_pos = pos
+        error = pos - self.t_event; self.errors.append(error)
+        if abs(error) > self.n_reset: self.offset += error; self.n_resets += 1
+        else: self.offset += error * self.k_correct
+    return self.t_event
+  def stamp(self) -> float:
+    """time of event being handled (as of last poll), its jitter is recorded"""
+    self.jitters.append(self.gap)
+    return self.t_event
+
+  def shift(self, dt:float): self.offset += dt
+  def pause(self):
+    if self.ns_paused == None: self.ns_paused = perf_counter_ns()
+  def resume(self):
+    if self.ns_paused != None: self.ns0 += perf_counter_ns() - self.ns_paused; self.ns_paused = None
+  @property
+  def paused(self) -> bool: return self.ns_paused != None
+
+  def report(self) -> str:
+    (j50, j95, j99) = percentiles(self.jitters)
+    text = f"{len(self.jitters)} events, jitter p50 {j50*SEC_MS:.2f}ms p95 {j95*SEC_MS:.2f}ms p99 {j99*SEC_MS:.2f}ms"
+    if len(self.errors) != 0:
+      (e50, e95, _) = percentiles([abs(e) for e in self.errors])
+      text += f", audio clock error p50 {e50*SEC_MS:.1f}ms p95 {e95*SEC_MS:.1f}ms ({self.n_resets} resets)"
+    return text
+
+class LoopMeter:
+  """Measure mode for event loops: CPU usage of this process, and dispatch latency of probe events
+  that a thread posts (by post(stamp)) every n_interval seconds and the loop hands back to onProbe.
+  """
+  def __init__(self, post:Callable[[float], Any], n_interval=0.05):
+    self.post = post; self.n_interval = n_interval
+    self.latencies:List[float] = []; self.running = False
+  def start(self):
+    self.running = True
+    self.t0, self.cpu0 = perf_counter(), process_time()
+    def postLoop():
+      while self.running: sleep(self.n_interval * (0.5 + random())); self.post(perf_counter()) #< random phase against loop timeouts
+    Thread(target=postLoop, daemon=True).start()
+  def onProbe(self, stamp:float): self.latencies.append(perf_counter() - stamp)
+  def stop(self) -> str:
+    self.running = False
+    (dt, cpu) = (perf_counter() - self.t0, process_time() - self.cpu0)
+    (l50, l95, l99) = percentiles(self.latencies)
+    return (f"CPU {cpu/max(dt, 1e-9)*100:.1f}% over {dt:.1f}s, {len(self.latencies)} probes dispatched after "
+      f"p50 {l50*SEC_MS:.2f}ms p95 {l95*SEC_MS:.2f}ms p99 {l99*SEC_MS:.2f}ms")
+
 class SwitchCall:
   def __init__(self, op, op1):
     self.flag = False
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+'''
+Interval index over timeline notes: "which notes overlap [t1, t2]" and "which note is nearest to t".
+
+Notes are kept sorted by start, with prefix maximum of ends (and where it's reached) beside them:
+notes starting before t2 that may still sound at t1 lie after the first prefix maximum >= t1, nearest is found in O(log n).
+Over them, levels of maximum ends per N_BLOCK notes, N_BLOCK^2 notes, ... form a tree that overlap queries descend
+only where some note ends at or after t1, so a long note never makes them scan all later notes:
+O(log n + k*N_BLOCK*depth) for k found notes, depth = log(n)/log(N_BLOCK) (4 levels for 16M notes).
+'''
+
+from typing import List, Optional
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .timeline import numpy
+
+N_BLOCK = 64 #< fan-out of block maximum levels, a power of 2
+B_SHIFT = N_BLOCK.bit_length() - 1
+N_VECTOR = 4 #< blocks opened at once in a level, from which numpy checks their children
+
+class IntervalIndex:
+  """notes as (start, end, id); ids are usually note numbers in a Timeline or TimelineFile"""
+  def __init__(self):
+    self.starts, self.ends, self.ids = array("d"), array("d"), array("i")
+    self.max_ends, self.max_at = array("d"), array("i") #< prefix maximum of ends, and its position
+    self.levels:List[array] = [] #< levels[j]: maximum end in each N_BLOCK^(j+1) notes, the last one has at most N_BLOCK
+  def __len__(self): return len(self.starts)
+  def __repr__(self): return f"IntervalIndex({len(self)} notes)"
+
+  @staticmethod
+  def fromColumns(starts, ends, ids=None) -> "IntervalIndex":
+    """index of starts/ends sequences (e.g. Timeline.column), ids are positions in them unless given"""
+    index = IntervalIndex()
+    n = len(starts)
+    if numpy != None:
+      (a_start, a_end) = (numpy.asarray(starts, dtype=numpy.float64), numpy.asarray(ends, dtype=numpy.float64))
+      order = numpy.argsort(a_start, kind="stable")
+      index.starts.frombytes(a_start[order].tobytes()); index.ends.frombytes(a_end[order].tobytes())
+      index.ids.frombytes((numpy.asarray(ids, dtype=numpy.int32)[order] if ids is not None else order.astype(numpy.int32)).tobytes())
+    else:
+      order = sorted(range(n), key=lambda i: starts[i])
+      index.starts.extend(starts[i] for i in order); index.ends.extend(ends[i] for i in order)
+      index.ids.extend(ids[i] if ids is not None else i for i in order)
+    index.rebuild(0)
+    return index
+
+  def rebuild(self, k:int):
+    """recompute prefix maximums and block maximum levels from position k"""
+    (ends, max_ends, max_at, levels) = (self.ends, self.max_ends, self.max_at, self.levels)
+    del max_ends[k:], max_at[k:]
+    (m, i_m) = (max_ends[-1], max_at[-1]) if k != 0 else (float("-inf"), -1)
+    for i in range(k, len(ends)):
+      if ends[i] > m: (m, i_m) = (ends[i], i)
+      max_ends.append(m); max_at.append(i_m)
+    (src, j) = (ends, 0)
+    while len(src) > N_BLOCK:
+      if j == len(levels): levels.append(array("d"))
+      k >>= B_SHIFT
+      del levels[j][k:]
+      for b in range(k << B_SHIFT, len(src), N_BLOCK): levels[j].append(max(src[b:b+N_BLOCK]))
+      (src, j) = (levels[j], j+1)
+    del levels[j:]
+
+  def insert(self, start:float, end:float, id:int):
+    """add a note, O(1) when notes come in start order (as they're recorded), else O(n)"""
+    n = len(self.starts)
+    if n == 0 or start >= self.starts[-1]:
+      self.starts.append(start); self.ends.append(end); self.ids.append(id)
+      (m, i_m) = (self.max_ends[-1], self.max_at[-1]) if n != 0 else (float("-inf"), -1)
+      self.max_ends.append(max(m, end)); self.max_at.append(n if end > m else i_m)
+      for (j, level) in enumerate(self.levels):
+        i = n >> (B_SHIFT*(j+1))
+        if i == len(level): level.append(end)
+        elif end > level[i]: level[i] = end
+      top = self.levels[-1] if len(self.levels) != 0 else self.ends
+      if len(top) > N_BLOCK: self.levels.append(array("d", (max(top[b:b+N_BLOCK]) for b in range(0, len(top), N_BLOCK))))
+      return
+    k = bisect_right(self.starts, start)
+    self.starts.insert(k, start); self.ends.insert(k, end); self.ids.insert(k, id)
+    self.rebuild(k)
+
+  def overlapping(self, t1:float, t2:float) -> List[int]:
+    """ids of notes with [start, end] intersecting [t1, t2], in start order"""
+    hi = bisect_right(self.starts, t2)
+    lo = bisect_left(self.max_ends, t1, 0, hi) #< notes before lo all end before t1
+    if lo >= hi: return []
+    (ends, ids, levels) = (self.ends, self.ids, self.levels)
+    if hi - lo <= N_BLOCK: return [ids[i] for i in range(lo, hi) if ends[i] >= t1]
+    depth = len(levels)
+    bounds = lambda j: (lo >> (B_SHIFT*j), ((hi-1) >> (B_SHIFT*j)) + 1) #< range of [lo, hi) in level j-1 (j=0 for notes)
+    (a, b) = bounds(depth)
+    top = levels[-1] if depth != 0 else ends
+    nodes = [i for i in range(a, b) if top[i] >= t1]
+    for j in reversed(range(depth)): #< children of nodes in level j-1, only ones ending at or after t1
+      (a, b) = bounds(j)
+      below = levels[j-1] if j != 0 else ends
+      if numpy != None and len(nodes) > N_VECTOR: #< views are dropped on return, so columns can still grow
+        nodes = ((numpy.asarray(nodes, dtype=numpy.int64) << B_SHIFT)[:, None] + numpy.arange(N_BLOCK)).ravel()
+        nodes = nodes[(nodes >= a) & (nodes < b)]
+        nodes = nodes[numpy.frombuffer(below, dtype=numpy.float64)[nodes] >= t1]
+      else: nodes = [c for node in nodes for c in range(max(node << B_SHIFT, a), min((node+1) << B_SHIFT, b)) if below[c] >= t1]
+    if isinstance(nodes, list): return [ids[i] for i in nodes]
+    return numpy.frombuffer(ids, dtype=numpy.int32)[nodes].tolist()
+  def at(self, t:float) -> List[int]: return self.overlapping(t, t)
+
+  def nearest(self, t:float) -> Optional[int]:
+    """id of note nearest to t (distance 0 if it sounds at t, ties go to the earlier one), or None when empty"""
+    n = len(self.starts)
+    if n == 0: return None
+    k = bisect_right(self.starts, t) #< notes before k start at or before t
+    d_prev = t - self.max_ends[k-1] if k != 0 else float("inf") #< the latest ending one of them
+    d_next = self.starts[k] - t if k != n else float("inf")
+    return self.ids[self.max_at[k-1]] if d_prev <= d_next else self.ids[k]
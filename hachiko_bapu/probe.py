@@ -0,0 +1,79 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Latency profile probe: run FluidSynth's file audio driver with each profile, then report effective settings
+and how regularly the driver thread delivers blocks (watched as growth of its output file, against wall clock).
+'''
+
+from typing import List, Tuple
+from argparse import ArgumentParser
+from tempfile import mkstemp
+from time import perf_counter_ns, sleep
+from os import close, remove, stat
+
+from .hachitools import percentiles, SEC_MS
+from .hachitools import LATENCY_PROFILES
+
+LATENCY_PROFILE_NAMES = list(LATENCY_PROFILES)
+
+N_FRAME_BYTES = 4 #< s16 stereo
+
+def watchGrowth(path, n_sec:float, n_poll:float) -> List[Tuple[int, int]]:
+  """(perf_counter_ns, size) each time file at path grows, over n_sec"""
+  changes = []; size = -1
+  ns_stop = perf_counter_ns() + int(n_sec*1e9)
+  while perf_counter_ns() < ns_stop:
+    n = stat(path).st_size
+    if n != size: changes.append((perf_counter_ns(), n)); size = n
+    sleep(n_poll)
+  return changes
+
+def probe(profile, n_sec=2.0, sample_rate=44100, n_poll=0.0002) -> dict:
+  """effective settings of profile, and timing of file driver writes:
+  interval between writes, and jitter (deviation of rendered audio position from wall clock, around its median)
+  """
+  from .synthesize import Synth #< FluidSynth is loaded here, not for "hachiko-probe -h"
+  (fd, path) = mkstemp(suffix=".pcm"); close(fd)
+  try:
+    synth = Synth(samplerate=sample_rate, profile=profile)
+    synth.setting("audio.file.name", path); synth.setting("audio.file.type", "raw")
+    synth.start(driver="file")
+    changes = watchGrowth(path, n_sec, n_poll)
+    settings = synth.effectiveSettings()
+    synth.stop()
+  finally: remove(path)
+  rate = settings["synth.sample-rate"] or sample_rate
+  writes = [(ns, size) for (ns, size) in changes if size != 0] #< file is created empty
+  intervals = [(b[0] - a[0]) / 1e9 for (a, b) in zip(writes, writes[1:])]
+  errors = [(ns - writes[0][0]) / 1e9 - (size - writes[0][1]) / N_FRAME_BYTES / rate for (ns, size) in writes]
+  mid = percentiles(errors, (50,))[0]
+  n_rendered = (writes[-1][1] - writes[0][1]) / N_FRAME_BYTES / rate if len(writes) != 0 else 0.0
+  n_watched = (writes[-1][0] - writes[0][0]) / 1e9 if len(writes) != 0 else 0.0
+  return {"profile": profile, "settings": settings, "writes": len(writes),
+    "interval_ms": dict(zip(("p50", "p95", "p99"), (t*SEC_MS for t in percentiles(intervals)))),
+    "jitter_ms": dict(zip(("p50", "p95", "p99"), (t*SEC_MS for t in percentiles([abs(e - mid) for e in errors])))),
+    "speed": n_rendered / n_watched if n_watched != 0 else 0.0}
+
+def formatProbe(res:dict) -> str:
+  fmt = lambda d: " ".join(f"{k} {v:.2f}ms" for (k, v) in d.items())
+  sets = res["settings"]
+  n_buffer = (sets["audio.period-size"] or 0) * (sets["audio.periods"] or 0) / (sets["synth.sample-rate"] or 1.0)
+  return (f"{res['profile']}: {', '.join(f'{k}={v}' for (k, v) in sets.items())} (buffers {n_buffer*SEC_MS:.1f}ms)\n"
+    f"  {res['writes']} writes, interval {fmt(res['interval_ms'])}; jitter {fmt(res['jitter_ms'])}; {res['speed']:.2f}x realtime")
+
+app = ArgumentParser(prog="hachiko-probe", description="Report effective FluidSynth settings and callback jitter of latency profiles, using the file audio driver",
+  epilog="hachiko takes a profile by -latency or LATENCY_PROFILE env-var")
+app.add_argument("profiles", nargs="*", type=str, metavar="profile", help=f"profiles to probe, of {'/'.join(LATENCY_PROFILE_NAMES)} (default all)")
+app.add_argument("-sec", type=float, default=2.0, help="seconds to run driver for each profile")
+app.add_argument("-sample-rate", type=int, default=44100, help="synth sample rate")
+
+from sys import argv
+def main(args = argv[1:]):
+  cfg = app.parse_args(args)
+  for name in cfg.profiles: #< not argparse choices, they reject empty nargs="*"
+    if name not in LATENCY_PROFILE_NAMES: app.error(f"unknown profile {name} (one of {', '.join(LATENCY_PROFILE_NAMES)})")
+  for name in cfg.profiles or LATENCY_PROFILE_NAMES:
+    print(formatProbe(probe(name, cfg.sec, cfg.sample_rate)))
+
+if __name__ == "__main__": main()
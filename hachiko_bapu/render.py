@@ -0,0 +1,198 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Offline renderer: SRT/MIDI pitch timeline -> WAV (or raw s16 stereo PCM)
+Audio is pulled from FluidSynth as fast as possible, no sound device is opened.
+'''
+
+from typing import List, Tuple
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from io import BytesIO
+from time import time
+from types import SimpleNamespace
+from os.path import dirname, join
+from array import array
+import wave
+
+from srt import parse as srt_parse
+
+from .hachitools import env
+from .synthesize import NoteSynth, Sequencer, numpy
+from .timeline import NO_PITCH
+
+Note = Tuple[float, float, int]
+
+INSTRUMENT_SF2 = env("SFONT", str, join(dirname(__file__), "instrument.sf2"))
+NOTE_BASE = env("NOTE_BASE", int, 45)
+N_CHANNEL, SAMPLE_WIDTH = 2, 2
+
+def readSrtNotes(path) -> List[Note]:
+  with open(path, "r", encoding="utf-8") as f:
+    pitchOf = lambda s: int(s) if s.strip().isdigit() else NOTE_BASE #< lyrics are sung on NOTE_BASE
+    return [(srt.start.total_seconds(), srt.end.total_seconds(), pitchOf(srt.content)) for srt in srt_parse(f.read())]
+
+def readMidiNotes(path) -> List[Note]:
+  from mido import MidiFile
+  from .cli_tools.srt2mid import transformBack
+  return list(transformBack(MidiFile(path), False).notes())
+
+def readTimelineNotes(path) -> List[Note]:
+  from .timeline_file import TimelineFile
+  with TimelineFile(path) as tf: return [(t1, t2, pitch if pitch != NO_PITCH else NOTE_BASE) for (t1, t2, pitch, _, _) in tf]
+
+def readNotes(path) -> List[Note]:
+  lower = path.lower()
+  if lower.endswith(".hkt"): return readTimelineNotes(path)
+  return readMidiNotes(path) if lower.endswith((".mid", ".midi")) else readSrtNotes(path)
+
+def readTrackNotes(path) -> List[List[Note]]:
+  """notes of each track in MIDI or .hkt with track index, other files are one track"""
+  from .timeline_file import readTimeline
+  lower = path.lower()
+  if not lower.endswith((".mid", ".midi", ".hkt")): return [readNotes(path)]
+  (timeline, tracks, _) = readTimeline(path)
+  if tracks == None: return [readNotes(path)]
+  parts = [[] for _ in range(max(tracks, default=-1) + 1)]
+  for ((t1, t2, pitch, _, _), i_track) in zip(timeline, tracks): parts[i_track].append((t1, t2, pitch if pitch != NO_PITCH else NOTE_BASE))
+  return [part for part in parts if len(part) != 0] #< tempo-only tracks have no notes
+
+def newSynth(sample_rate, path_sfont, idx_preset, audio_channels=1) -> NoteSynth:
+  synth = NoteSynth(sample_rate, audio_channels=audio_channels)
+  synth.setFont(path_sfont, idx_preset)
+  return synth
+
+def renderTracks(tracks:List[List[Note]], sample_rate, path_sfont, idx_preset=0, n_tail=1.0):
+  """Render each track on its own MIDI channel and stereo pair of one synth (fluid_synth_process),
+  as float32 (2*len(tracks), n_frames) ndarray: rows 2i, 2i+1 are left and right of track i (dry, no reverb/chorus)
+  """
+  synth = newSynth(sample_rate, path_sfont, idx_preset, audio_channels=max(1, len(tracks)))
+  seq = Sequencer(synth)
+  for (chan, notes) in enumerate(tracks): seq.add(notes, chan=chan)
+  return seq.renderChannels(n_tail)
+
+def mixTracks(stems, gains=None):
+  """sum (2*n_track, n) planar float32 stems into (2, n) stereo, with per track gains"""
+  pairs = stems.reshape(-1, 2, stems.shape[1])
+  if gains is not None: pairs = pairs * numpy.asarray(gains, dtype=numpy.float32)[:, None, None]
+  return pairs.sum(axis=0, dtype=numpy.float32)
+
+def floatPcm(stereo) -> bytes:
+  """(2, n) planar float32 into interleaved s16 PCM, clipping"""
+  return numpy.clip(numpy.rint(stereo.T * 0x7fff), -0x8000, 0x7fff).astype("<i2").tobytes()
+
+@contextmanager
+def openPcm(path_out, sample_rate, is_raw=False):
+  """file-like object accepting s16 stereo PCM writes, as raw file or WAV"""
+  if is_raw:
+    with open(path_out, "wb") as out: yield out
+    return
+  with wave.open(path_out, "wb") as out:
+    out.setnchannels(N_CHANNEL); out.setsampwidth(SAMPLE_WIDTH); out.setframerate(sample_rate)
+    yield SimpleNamespace(write=out.writeframesraw) #< wave header is patched on close
+
+def renderFile(notes, path_out, synth:NoteSynth, is_raw=False, n_tail=1.0) -> int:
+  with openPcm(path_out, synth.sample_rate, is_raw) as out:
+    return synth.renderNotes(notes, out, n_tail)
+
+def splitSegments(notes, n_frame_segment, sample_rate) -> List[Tuple[int, List[Note]]]:
+  """group notes by the segment their onset falls in, as (frame offset, notes) sorted by offset"""
+  segs = {}
+  for note in notes:
+    k = round(note[0]*sample_rate) // n_frame_segment
+    segs.setdefault(k, []).append(note)
+  return [(k*n_frame_segment, segs[k]) for k in sorted(segs.keys())]
+
+def renderSegment(task) -> Tuple[int, bytes]:
+  """worker: render notes of one segment with a fresh synth, until all voices have released"""
+  (n_offset, notes, sample_rate, path_sfont, idx_preset, n_tail) = task
+  buf = BytesIO()
+  newSynth(sample_rate, path_sfont, idx_preset).renderNotes(notes, buf, n_tail, n_offset=n_offset)
+  return (n_offset, buf.getvalue())
+
+def mixPcm(pending, start, stop) -> bytes:
+  """sum s16 stereo (frame offset, pcm) segments over frames [start, stop), clipping to 16-bit"""
+  n = (stop - start)*N_CHANNEL
+  if numpy != None:
+    acc = numpy.zeros(n, dtype=numpy.int32)
+    for (offset, pcm) in pending:
+      samples = numpy.frombuffer(pcm, dtype=numpy.int16)
+      (a, b) = (max(start, offset), min(stop, offset + len(samples)//N_CHANNEL))
+      if a < b: acc[(a-start)*N_CHANNEL:(b-start)*N_CHANNEL] += samples[(a-offset)*N_CHANNEL:(b-offset)*N_CHANNEL]
+    return numpy.clip(acc, -0x8000, 0x7fff).astype(numpy.int16).tobytes()
+  acc = [0] * n
+  for (offset, pcm) in pending:
+    samples = array("h", pcm)
+    (a, b) = (max(start, offset), min(stop, offset + len(samples)//N_CHANNEL))
+    for i in range((a-offset)*N_CHANNEL, (b-offset)*N_CHANNEL): acc[i + (offset-start)*N_CHANNEL] += samples[i]
+  return array("h", (min(max(x, -0x8000), 0x7fff) for x in acc)).tobytes()
+
+def renderParallel(notes, out, sample_rate, path_sfont, idx_preset=0, n_jobs=1, n_sec_segment=30.0, n_tail=1.0) -> int:
+  """Render notes in time segments, one fresh synth per segment (in n_jobs worker processes), then overlap-add them.
+  Each segment renders past its end until its notes' release tail (n_tail) decays, so voices are never cut.
+  Output depends only on n_sec_segment, never on n_jobs; segments are mixed and written to out in order.
+  With fewer than two segments it renders them in one synth as renderSegment would (and the tail of empty input). Returns the count of written frames.
+  """
+  n_frame_segment = max(1, round(n_sec_segment*sample_rate))
+  segs = splitSegments(notes, n_frame_segment, sample_rate)
+  if len(segs) < 2: return newSynth(sample_rate, path_sfont, idx_preset).renderNotes(notes, out, n_tail) #< also renders the tail of empty input
+  tasks = [(offset, seg, sample_rate, path_sfont, idx_preset, n_tail) for (offset, seg) in segs]
+  offsets = [offset for (offset, _) in segs] + [None]
+  pending = []; pos = 0
+
+  def flush(stop):
+    nonlocal pending, pos
+    if stop <= pos: return
+    out.write(mixPcm(pending, pos, stop))
+    pos = stop
+    pending = [seg for seg in pending if seg[0] + len(seg[1])//(N_CHANNEL*SAMPLE_WIDTH) > pos]
+  def consume(results):
+    for (i, result) in enumerate(results):
+      pending.append(result)
+      next_offset = offsets[i+1] #< frames before it are final, later segments start after
+      flush(next_offset if next_offset != None else max(o + len(pcm)//(N_CHANNEL*SAMPLE_WIDTH) for (o, pcm) in pending))
+
+  if n_jobs <= 1: consume(map(renderSegment, tasks))
+  else:
+    from multiprocessing import Pool
+    with Pool(n_jobs) as pool: consume(pool.imap(renderSegment, tasks))
+  return pos
+
+app = ArgumentParser(prog="hachiko-render", description="Render SRT/MIDI pitch timeline into audio file, without sound device",
+  epilog="Useful env-vars: SFONT (sf2 path), NOTE_BASE (pitch for lyrics)")
+app.add_argument("-o", type=str, default=None, help="output file (only for single input, default is input path with .wav/.pcm)")
+app.add_argument("-note-preset", type=int, default=0, help="SoundFont preset index, count from 0")
+app.add_argument("-sample-rate", type=int, default=44100, help="output sample rate")
+app.add_argument("-tail", type=float, default=1.0, help="seconds rendered after last noteoff, for release")
+app.add_argument("-raw", action="store_true", default=False, help="write raw s16 stereo PCM instead of WAV")
+app.add_argument("-j", type=int, default=1, help="worker processes for segmented rendering (1 renders segments in-process)")
+app.add_argument("-segment", type=float, default=0.0, help="segment length in seconds, output is identical for any -j (default 0 renders serially in one synth)")
+app.add_argument("-stems", action="store_true", default=False, help="render tracks (of MIDI or .hkt) on separate channels in float, write each as path.N.wav besides their mix (needs numpy)")
+app.add_argument("files", nargs="+", type=str, help="SRT (pitch or lyrics), MIDI or .hkt timeline files")
+
+from sys import argv, stderr
+def main(args = argv[1:]):
+  cfg = app.parse_args(args)
+  if cfg.o != None and len(cfg.files) != 1: app.error("-o requires a single input")
+  ext = "pcm" if cfg.raw else "wav"
+  for path in cfg.files:
+    path_out = cfg.o or path.rsplit(".", 1)[0] + f".{ext}"
+    t0 = time()
+    if cfg.stems:
+      stems = renderTracks(readTrackNotes(path), cfg.sample_rate, INSTRUMENT_SF2, cfg.note_preset, cfg.tail)
+      for i in range(stems.shape[0] // 2):
+        with openPcm(path_out.rsplit(".", 1)[0] + f".{i}.{ext}", cfg.sample_rate, cfg.raw) as out: out.write(floatPcm(stems[2*i:2*i+2]))
+      with openPcm(path_out, cfg.sample_rate, cfg.raw) as out: out.write(floatPcm(mixTracks(stems)))
+      n = stems.shape[1]
+    elif cfg.segment > 0:
+      with openPcm(path_out, cfg.sample_rate, cfg.raw) as out:
+        n = renderParallel(readNotes(path), out, cfg.sample_rate, INSTRUMENT_SF2, cfg.note_preset, cfg.j, cfg.segment, cfg.tail)
+    else:
+      synth = newSynth(cfg.sample_rate, INSTRUMENT_SF2, cfg.note_preset) #< fresh synth per file, no tail leak
+      n = renderFile(readNotes(path), path_out, synth, cfg.raw, cfg.tail)
+    dt = time() - t0
+    n_sec = n / cfg.sample_rate
+    print(f"{path} -> {path_out}: {n_sec:.1f}s audio in {dt:.2f}s ({n_sec/max(dt, 1e-9):.0f}x realtime)", file=stderr)
+
+if __name__ == "__main__": main()
@@ -1,39 +1,77 @@
 # -*- coding: utf-8 -*-
 
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 
-from ctypes import sizeof, create_string_buffer, c_int16
+from ctypes import sizeof, byref, create_string_buffer, c_int16, c_int, c_double, c_void_p
 from .funutils import *
-from sf2utils.sf2parse import Sf2File
+from os import environ, stat, makedirs, replace
+from os.path import abspath, expanduser, join
+from hashlib import sha1
+from json import load, dump
+from threading import Lock
+from collections import deque
+from time import perf_counter_ns
 
 try: import numpy
-except ImportError: pass
+except ImportError: numpy = None #< samples are given as memoryview of int16 ('h') instead, float rendering needs it
 
-drivers = ["alsa", "oss", "jack", "pulseaudio", "portaudio", "sndmgr", "coreaudio", "dsound", "waveout"]
+drivers = ["alsa", "oss", "jack", "pulseaudio", "portaudio", "sndmgr", "coreaudio", "dsound", "waveout", "file"]
 platform_drivers = {"linux": "alsa", "windows": "dsound", "macos": "coreaudio"}
 
 from .funutils import isNonnegative, isInbounds
 from .FluidSynth import *
+from .hachitools import percentiles, LATENCY_PROFILES
+
+N_AUDITION_VOICES = 8
+AUDIO_DEFAULTS = {"audio.period-size": 64, "audio.periods": 16} #< FluidSynth 2 defaults (Linux/macOS), when not readable
+NO_VALUE = -0x7fffffff #< sentinel left in getter outputs the library didn't write
+
+PROFILE_BOUNDS = {"audio.period-size": (64, 8192), "audio.periods": (2, 64), "synth.cpu-cores": (1, 256), "synth.polyphony": (1, 65535)}
+
+def profileSettings(name:str) -> dict:
+  """settings of latency profile name, checked against PROFILE_BOUNDS"""
+  require(name, LATENCY_PROFILES.__contains__, f"unknown latency profile (one of {', '.join(LATENCY_PROFILES)})")
+  sets = LATENCY_PROFILES[name]
+  for (k, v) in sets.items(): require(v, isInbounds(PROFILE_BOUNDS[k][0], PROFILE_BOUNDS[k][1]+1), f"bad {k} in profile {name}")
+  return sets
+
+def samplesView(buf, n_sample: int):
+  """int16 view of first n_sample samples in buf without copy: ndarray, or memoryview when numpy is absent"""
+  if numpy != None: return numpy.frombuffer(buf, dtype=numpy.int16, count=n_sample)
+  return memoryview(buf).cast("B").cast("h")[:n_sample]
+
+def fluid_synth_write_s16_into(synth, n: int, cbuf, n_channel=2):
+  """Write n frames of interleaved 16-bit samples into ctypes int16 array cbuf"""
+  fluid_synth_write_s16(synth, n, cbuf, 0, n_channel, cbuf, 1, n_channel)
 
 def fluid_synth_write_s16_stereo(synth, n: int, n_channel=2) -> List[int]:
   """Return generated samples in stereo 16-bit format"""
-  buf = create_string_buffer(n*n_channel*sizeof(c_int16))
-  fluid_synth_write_s16(synth, n, buf, 0, n_channel, buf, 1, n_channel)
-  return numpy.frombuffer(buf.raw, dtype=numpy.int16) #origin: copy buf[:]
+  buf = bytearray(n*n_channel*sizeof(c_int16))
+  fluid_synth_write_s16_into(synth, n, (c_int16 * (n*n_channel)).from_buffer(buf), n_channel)
+  return samplesView(buf, n*n_channel)
 
 class Synth:
   """Synth represents a FluidSynth synthesizer"""
-  def __init__(self, gain=0.2, samplerate=44100, channels=256):
+  def __init__(self, gain=0.2, samplerate=44100, channels=256, profile=None, audio_channels=1):
+    """profile is a name in LATENCY_PROFILES, None keeps library defaults.
+    audio_channels is the count of stereo pairs process() renders, MIDI channel i sounds in pair i % audio_channels
+    """
+    self.settings, self.synth, self.audio_driver = None, None, None #< for __del__ when a check fails
+    require(audio_channels, isInbounds(1, 129), "bad audio channel count") #v checked before any FluidSynth object exists
+    profile_sets = profileSettings(profile) if profile != None else {}
     self.settings = new_fluid_settings()
-    self.synth = new_fluid_synth(self.settings)
+    self.audio_channels = audio_channels
     for (k, v) in { b"synth.gain": gain,
-      b"synth.sample-rate": samplerate,
-      b"synth.midi-channels": channels }.items(): self.setting(k, v)
-    self.audio_driver = None
+      b"synth.sample-rate": float(samplerate),
+      b"synth.midi-channels": channels,
+      b"synth.audio-channels": audio_channels, b"synth.audio-groups": audio_channels }.items(): self.setting(k, v)
+    for (k, v) in profile_sets.items(): self.checkedSetting(k, v) #< library range may still refuse it
+    self.synth = new_fluid_synth(self.settings) #< settings like sample-rate, cpu-cores are read only on creation
+    self.block_pool, self.block_cbuf = None, None
   def __del__(self):
-    if self.audio_driver != None: delete_fluid_audio_driver(self.audio_driver)
-    delete_fluid_synth(self.synth)
-    delete_fluid_settings(self.settings)
+    self.stop()
+    if getattr(self, "synth", None) != None: delete_fluid_synth(self.synth)
+    if getattr(self, "settings", None) != None: delete_fluid_settings(self.settings)
 
   def setting(self, key, value):
     bk = key.encode() if isinstance(key, str) else key
@@ -45,6 +83,25 @@ class Synth:
     elif isinstance(value, str):
       fluid_settings_setstr(sets, bk, value.encode())
 
+  def getting(self, key, t=int):
+    """effective value of setting key as t (int, float or str), None when the library doesn't know it"""
+    bk = key.encode() if isinstance(key, str) else key
+    if t == str:
+      buf = create_string_buffer(256)
+      fluid_settings_copystr(self.settings, bk, buf, len(buf))
+      return buf.value.decode() if len(buf.value) != 0 else None
+    val = c_int(NO_VALUE) if t == int else c_double(float(NO_VALUE)) #< return codes differ in FluidSynth 1 and 2, unchanged one means failure
+    (fluid_settings_getint if t == int else fluid_settings_getnum)(self.settings, bk, byref(val))
+    return t(val.value) if val.value != NO_VALUE else None
+  def checkedSetting(self, key, value:int):
+    """set int setting, which must be in the range the library accepts (when it tells)"""
+    (lo, hi) = (c_int(NO_VALUE), c_int(NO_VALUE))
+    fluid_settings_getint_range(self.settings, key.encode(), byref(lo), byref(hi))
+    if lo.value != NO_VALUE and hi.value != NO_VALUE: require(value, isInbounds(lo.value, hi.value+1), f"{key} out of [{lo.value}, {hi.value}]")
+    self.setting(key, value)
+  def effectiveSettings(self, keys=("audio.driver", "synth.sample-rate", *PROFILE_BOUNDS)) -> dict:
+    return {k: self.getting(k, str if k == "audio.driver" else float if k == "synth.sample-rate" else int) for k in keys}
+
   def sfload(self, filename, update_midi_preset=0) -> int:
     return fluid_synth_sfload(self.synth, filename.encode(), update_midi_preset)
   def sfunload(self, sfid, update_midi_preset=0):
@@ -68,6 +125,8 @@ class Synth:
     self.setting(b"audio.driver", driver)
     if device is not None: self.setting(f"audio.{driver}.device", device)
     self.audio_driver = new_fluid_audio_driver(self.settings, self.synth)
+  def stop(self):
+    if getattr(self, "audio_driver", None) != None: delete_fluid_audio_driver(self.audio_driver); self.audio_driver = None
   def get_samples(self, n=1024) -> List[int]:
     """Generate audio samples
     Returns ndarray containing n audio samples.
@@ -75,23 +134,106 @@ class Synth:
     """
     return fluid_synth_write_s16_stereo(self.synth, n)
 
+  def render_block(self, n=1024, out=None) -> List[int]:
+    """Render n stereo frames into writable buffer out (ndarray, bytearray or memoryview of >= 4*n bytes),
+    or into a pooled buffer owned by this synth when out is None, without allocating samples per call.
+    Returns int16 view (ndarray, or memoryview 'h' without numpy) of the 2*n samples,
+    a pooled view is only valid until next render_block call.
+    """
+    n_sample = n*2
+    if out is not None: #< ndarray has no truth value
+      buf = out; cbuf = (c_int16 * n_sample).from_buffer(out)
+    else: (buf, cbuf) = self.blockPool(n_sample)
+    fluid_synth_write_s16_into(self.synth, n, cbuf)
+    return samplesView(buf, n_sample)
+  def blockPool(self, n_sample):
+    """(bytearray, ctypes int16 array on it) of >= n_sample samples owned by this synth"""
+    if self.block_pool == None or len(self.block_cbuf) < n_sample: #< grows on larger blocks only
+      self.block_pool = bytearray(n_sample*sizeof(c_int16))
+      self.block_cbuf = (c_int16 * n_sample).from_buffer(self.block_pool)
+    return (self.block_pool, self.block_cbuf)
+
+  def render_float(self, n=1024, planar=False):
+    """Render n stereo frames as float32 ndarray, (2, n) planar or (n, 2) interleaved, by fluid_synth_write_float"""
+    if numpy == None: raise ImportError("float rendering needs numpy")
+    out = numpy.empty((2, n) if planar else (n, 2), dtype=numpy.float32)
+    ptr = out.ctypes.data
+    if planar: fluid_synth_write_float(self.synth, n, ptr, 0, 1, ptr, n, 1)
+    else: fluid_synth_write_float(self.synth, n, ptr, 0, 2, ptr, 1, 2)
+    return out
+
+  def process(self, n=1024, out=None, effects=None):
+    """Render n frames of every stereo pair (see audio_channels) by fluid_synth_process, as planar float32
+    (2*audio_channels, n) ndarray: rows 2i, 2i+1 are left and right of pair i.
+    out may be such an ndarray (or a column slice of a larger one) to render into.
+    effects (default for one pair) mixes reverb and chorus into the first pair, else pairs are dry.
+    """
+    if numpy == None: raise ImportError("float rendering needs numpy")
+    n_out = 2*self.audio_channels
+    if out is None: out = numpy.zeros((n_out, n), dtype=numpy.float32)
+    else:
+      require(out, lambda a: a.dtype == numpy.float32 and a.shape == (n_out, n) and a.strides[1] == 4, "bad output array")
+      out[:] = 0.0 #< fluid_synth_process adds into buffers
+    rows = [out.ctypes.data + i*out.strides[0] for i in range(n_out)]
+    fx = []
+    if effects if effects != None else self.audio_channels == 1:
+      fx = rows[0:2] * (self.getting("synth.effects-channels") or 2) #< reverb and chorus pairs alias the dry one
+    fluid_synth_process(self.synth, n, len(fx), (c_void_p * len(fx))(*fx) if len(fx) != 0 else None, n_out, (c_void_p * n_out)(*rows))
+    return out
+
+  def bufferLatency(self) -> float:
+    """seconds of audio queued in driver buffers (audio.period-size * audio.periods), the floor of note response"""
+    (n_period, n_periods) = (self.getting(k) or v for (k, v) in AUDIO_DEFAULTS.items())
+    return n_period*n_periods / (self.getting("synth.sample-rate", float) or 44100.0)
+
 class NoteSynth(Synth):
-  def __init__(self, sample_rate):
-    super().__init__(samplerate=sample_rate)
+  """Single instrument synth: noteon/noteSwitch on channel 0,
+  and an audition pool of n_voices channels (from 1) for overlapping notes played by keys.
+  """
+  def __init__(self, sample_rate, n_voices=N_AUDITION_VOICES, velocity=127, profile=None, audio_channels=1):
+    require(velocity, isInbounds(0, 128), "bad velocity") #< audition args are checked once here, not per note
+    require(n_voices, lambda n: 1 <= n < 256, "bad voice count")
+    super().__init__(samplerate=sample_rate, profile=profile, audio_channels=audio_channels)
     self.sample_rate = sample_rate
     self.last_pitch = (-1)
+    self.font = None #< (path, preset index) once loaded
+    self.velocity = velocity
+    self.voices = [None] * (n_voices+1) #< pitch sounding on each channel, 0 is unused
+    self.free, self.busy = deque(range(1, n_voices+1)), deque() #< channels, in release / start order
+    self.switched = None #< channel of last switch()
+    self.pool_lock = Lock() #< release() may come from timer thread
+    self.latencies = deque(maxlen=1000) #< us from key to noteon
   @staticmethod
   def getFontPresets(path_sfont) -> List[Tuple[int, int, str]]:
+    from sf2utils.sf2parse import Sf2File
     with open(path_sfont, "rb") as fbuf:
       sf = Sf2File(fbuf) #< parse sf2
       return [(p.bank, p.preset, p.name) for p in sf.build_presets() if len(p.bags) != 0]
+  @staticmethod
+  def listFontPresets(path_sfont) -> List[Tuple[int, int, str]]:
+    """getFontPresets, but read from the on-disk preset index when path, size, mtime and content hash still match"""
+    key = fontIndexKey(path_sfont)
+    path_index = fontIndexPath(key["path"])
+    try:
+      with open(path_index, "r", encoding="utf-8") as f: index = load(f)
+      if index["key"] == key: return [tuple(p) for p in index["presets"]]
+    except (OSError, ValueError, KeyError, TypeError): pass #< missing or stale
+    presets = NoteSynth.getFontPresets(path_sfont)
+    try: #v write-then-rename, so concurrent launches never see half index
+      makedirs(fontIndexPath(), exist_ok=True)
+      with open(path_index + ".tmp", "w", encoding="utf-8") as f: dump({"key": key, "presets": presets}, f)
+      replace(path_index + ".tmp", path_index)
+    except OSError: pass #< read-only cache is fine
+    return presets
 
   def setFont(self, path_sfont, idx_preset=0):
-    presets = NoteSynth.getFontPresets(path_sfont)
+    presets = NoteSynth.listFontPresets(path_sfont)
     require(presets, hasIndex(idx_preset), "preset outbounds")
     preset = presets[idx_preset]
     (bank, patch, _) = preset
-    self.program_select(0, self.sfload(path_sfont), bank, patch)
+    sfid = self.sfload(path_sfont)
+    for chan in range(max(len(self.voices), self.audio_channels)): self.program_select(chan, sfid, bank, patch) #< pool (and track channels) are ready before first key
+    self.font = (path_sfont, idx_preset)
 
   def noteon(self, pitch): return super().noteon(0, pitch)
   def noteoff(self, pitch=None):
@@ -103,5 +245,154 @@ class NoteSynth(Synth):
     self.noteon(pitch)
     self.last_pitch = pitch
 
+  def audition(self, pitch:int, ns_key:Optional[int]=None) -> int:
+    """Start pitch on a free pool channel (or steal the longest sounding one), calling FluidSynth directly.
+    ns_key is perf_counter_ns() when the key was taken, its latency to noteon is recorded. Returns the channel.
+    """
+    if not 0 <= pitch < 128: raise ValueError(f"bad key: {pitch}")
+    with self.pool_lock:
+      if len(self.free) != 0: chan = self.free.popleft()
+      else:
+        chan = self.busy.popleft()
+        fluid_synth_noteoff(self.synth, chan, self.voices[chan])
+        if chan == self.switched: self.switched = None
+      fluid_synth_noteon(self.synth, chan, pitch, self.velocity)
+      if ns_key != None: self.latencies.append((perf_counter_ns() - ns_key) / 1000)
+      self.voices[chan] = pitch; self.busy.append(chan)
+    return chan
+  def release(self, pitch:Optional[int]=None) -> bool:
+    """noteoff the earliest pool voice of pitch, or the last switch() one when None. False if none sounds"""
+    with self.pool_lock:
+      if pitch == None: chan = self.switched; self.switched = None
+      else: chan = next((ch for ch in self.busy if self.voices[ch] == pitch), None)
+      if chan == None or self.voices[chan] == None: return False
+      if chan == self.switched: self.switched = None
+      fluid_synth_noteoff(self.synth, chan, self.voices[chan])
+      self.voices[chan] = None; self.busy.remove(chan); self.free.append(chan) #< reused last, its release tail isn't cut
+      return True
+  def switch(self, pitch:int, ns_key:Optional[int]=None) -> int:
+    """audition pitch in place of the last switched one, like noteSwitch"""
+    self.release()
+    chan = self.audition(pitch, ns_key)
+    self.switched = chan
+    return chan
+  def silence(self):
+    while len(self.busy) != 0: self.release(self.voices[self.busy[0]])
+  def reset(self):
+    """cut every sounding voice (release tails too) and reset controllers, keeping selected programs"""
+    self.silence(); self.switched = None; self.last_pitch = (-1)
+    for chan in range(max(len(self.voices), self.audio_channels)):
+      fluid_synth_cc(self.synth, chan, 120, 0) #< all sound off
+      fluid_synth_cc(self.synth, chan, 121, 0) #< reset all controllers
+
+  def auditionLatency(self, ps=(50, 95, 99)) -> List[float]:
+    """percentiles of key to noteon latency in microseconds, over last 1000 auditions"""
+    return percentiles(list(self.latencies), ps)
+  def auditionReport(self) -> str:
+    (l50, l95, l99) = self.auditionLatency()
+    return (f"{len(self.latencies)} auditions, key to noteon p50 {l50:.0f}us p95 {l95:.0f}us p99 {l99:.0f}us, "
+      f"audio buffers {self.bufferLatency()*1000:.1f}ms")
+
   def sampleNote(self, n_sec) -> List[int]:
     return self.get_samples(self.sample_rate*n_sec)
+
+  def renderNotes(self, notes, out, n_tail=1.0, n_block=1024, n_offset=0) -> int:
+    """Render (t1, t2, pitch) notes into s16 stereo PCM written to out, without any audio driver.
+    Blocks are split at event boundaries, so noteon/noteoff land on exact sample offsets.
+    Output starts at frame n_offset of the timeline; returns the count of rendered frames.
+    """
+    return Sequencer(self, notes, n_offset).render(out, n_tail, n_block)
+
+class Sequencer:
+  """Whole timeline of notes played on a NoteSynth at exact sample offsets, without wall clock:
+  write_s16 block calls are split where events fall, so noteon/noteoff land between the right samples.
+  Rendering is pulled by pull(n) (as an audio callback would) or render(out) for all of it,
+  pullChannels/renderChannels give float32 of every stereo pair instead (tracks added on chan c sound in pair c).
+  """
+  def __init__(self, synth:NoteSynth, notes=(), n_offset=0):
+    self.synth = synth
+    self.events:List[Tuple[int, bool, int, int]] = [] #< (frame, is_on, pitch, chan)
+    self.pos = 0; self.i = 0 #< next frame to render, next event to apply
+    self.applied = [] #< (scheduled frame, frame it was applied at) of each applied event
+    self.add(notes, n_offset)
+  def add(self, notes, n_offset=0, chan=0):
+    """schedule (t1, t2, pitch) notes of a timeline starting at frame n_offset on MIDI channel chan,
+    events already past are applied at once"""
+    pending = self.events[self.i:] + [(at, is_on, pitch, chan) for (at, is_on, pitch) in noteEvents(notes, self.synth.sample_rate, n_offset)]
+    pending.sort()
+    self.events[self.i:] = pending
+  def __len__(self):
+    """frames until the last event"""
+    return self.events[-1][0] if len(self.events) != 0 else 0
+
+  def advance(self, n:int, renderPart):
+    """next n frames, split where events fall: events are applied on their frames, renderPart(k, m) renders m frames from k-th one"""
+    (synth, events) = (self.synth, self.events)
+    (pos, stop) = (self.pos, self.pos + n)
+    while pos < stop:
+      while self.i < len(events) and events[self.i][0] <= pos:
+        (at, is_on, pitch, chan) = events[self.i]
+        if is_on: Synth.noteon(synth, chan, pitch)
+        else: Synth.noteoff(synth, chan, pitch)
+        self.applied.append((at, pos)); self.i += 1
+      end = min(stop, events[self.i][0] if self.i < len(events) else stop)
+      renderPart(pos - self.pos, end - pos)
+      pos = end
+    self.pos = stop
+
+  def pull(self, n:int, out=None):
+    """render next n frames into out (writable buffer of >= 4*n bytes, or pooled buffer of synth),
+    applying events on their frames. Returns int16 view of the 2*n samples"""
+    if out is None: (out, _) = self.synth.blockPool(n*2)
+    buf = memoryview(out).cast("B")
+    self.advance(n, lambda k, m: self.synth.render_block(m, buf[k*4:(k+m)*4]))
+    return samplesView(out, n*2)
+  def pullChannels(self, n:int, out=None):
+    """render next n frames of every stereo pair into out (or a new array), as Synth.process"""
+    if out is None: out = numpy.zeros((2*self.synth.audio_channels, n), dtype=numpy.float32)
+    self.advance(n, lambda k, m: self.synth.process(m, out[:, k:k+m]))
+    return out
+
+  def render(self, out, n_tail=1.0, n_block=1024) -> int:
+    """write s16 stereo PCM of rest of the timeline (and n_tail seconds after it, for release) to out.
+    Returns the count of rendered frames"""
+    n_total = len(self) + int(n_tail*self.synth.sample_rate)
+    while self.pos < n_total:
+      out.write(self.pull(min(n_block, n_total - self.pos)))
+    return self.pos
+  def renderChannels(self, n_tail=1.0, n_block=4096):
+    """float32 (2*audio_channels, n) array of rest of the timeline and n_tail seconds after it"""
+    n_total = len(self) + int(n_tail*self.synth.sample_rate)
+    out = numpy.zeros((2*self.synth.audio_channels, max(0, n_total - self.pos)), dtype=numpy.float32)
+    (pos0, n) = (self.pos, out.shape[1])
+    while self.pos - pos0 < n:
+      k = self.pos - pos0
+      self.pullChannels(min(n_block, n - k), out[:, k:k + min(n_block, n - k)])
+    return out
+
+N_HASH_BYTES = 64*1024
+def fontIndexKey(path_sfont) -> dict:
+  """identity of a SoundFont: path, size, mtime and hash of its head and tail (not whole body, it could be 100+MB)"""
+  path = abspath(path_sfont)
+  st = stat(path)
+  digest = sha1()
+  with open(path, "rb") as f:
+    digest.update(f.read(N_HASH_BYTES))
+    if st.st_size > N_HASH_BYTES:
+      f.seek(max(N_HASH_BYTES, st.st_size - N_HASH_BYTES)); digest.update(f.read())
+  return {"path": path, "size": st.st_size, "mtime": st.st_mtime_ns, "hash": digest.hexdigest()}
+
+def fontIndexPath(path_sfont=None) -> str:
+  """$XDG_CACHE_HOME/hachiko/presets (or its index file for a SoundFont path)"""
+  root = join(environ.get("XDG_CACHE_HOME") or expanduser("~/.cache"), "hachiko", "presets")
+  return root if path_sfont == None else join(root, sha1(path_sfont.encode()).hexdigest() + ".json")
+
+def noteEvents(notes, sample_rate, n_offset=0) -> List[Tuple[int, bool, int]]:
+  """(t1, t2, pitch) timeline into sorted (sample, is_on, pitch) events, noteoff goes first on same sample"""
+  events = []
+  for (t1, t2, pitch) in notes:
+    on = round(t1*sample_rate) - n_offset
+    events.append((on, True, pitch))
+    events.append((max(on+1, round(t2*sample_rate) - n_offset), False, pitch)) #< zero-length notes still get released
+  events.sort()
+  return events
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+'''
+Timeline: compact columnar note model shared by hachi, srt2mid and lrc_merge.
+
+Bulk SRT/LRC writers: timestamps of a whole batch are formatted by numpy arithmetic into fixed-width text,
+then written straight to a file handle, no timedelta/Subtitle per note.
+Output is same as srt.compose (SRT) and "%02i:%02i.%02i" headers (LRC); without numpy each timestamp is formatted in Python.
+'''
+
+from typing import Iterable, Iterator, List, Optional, Tuple
+from srt import timedelta_to_srt_timestamp
+from datetime import timedelta
+from array import array
+from struct import pack, unpack
+from sys import byteorder
+
+from .hachitools import DEFAULT_VELOCITY
+
+try: import numpy
+except ImportError: numpy = None
+
+N_BATCH = 1 << 16 #< notes formatted per numpy batch, bounds temporary memory
+
+def digitsInto(mat, col, xs, n_digit):
+  """write n_digit decimal ASCII digits of int array xs into columns [col, col+n_digit) of uint8 mat"""
+  for i in reversed(range(col, col+n_digit)):
+    mat[:, i] = xs % 10 + 0x30; xs = xs // 10
+
+def srtMicros(seconds):
+  """seconds to microseconds, rounded same as timedelta(seconds=s)"""
+  (frac, whole) = numpy.modf(numpy.asarray(seconds, dtype=numpy.float64))
+  return whole.astype(numpy.int64)*1000000 + numpy.rint(frac*1e6).astype(numpy.int64)
+
+SRT_CODE = b"00:00:00,000"
+def srtCodesInto(mat, col, us):
+  ms = us // 1000
+  (h, ms) = numpy.divmod(ms, 3600000); (m, ms) = numpy.divmod(ms, 60000); (s, ms) = numpy.divmod(ms, 1000)
+  for (i, xs, n) in [(0, h, 2), (3, m, 2), (6, s, 2), (9, ms, 3)]: digitsInto(mat, col+i, xs, n)
+
+def fixedRows(mat) -> List[str]:
+  width = mat.shape[1]; text = mat.tobytes().decode("ascii")
+  return [text[i:i+width] for i in range(0, len(text), width)]
+
+SRT_RANGE = SRT_CODE + b" --> " + SRT_CODE
+def srtRanges(us1, us2) -> List[str]:
+  """ "HH:MM:SS,mmm --> HH:MM:SS,mmm" for microsecond arrays, hours must be < 100"""
+  mat = numpy.tile(numpy.frombuffer(SRT_RANGE, dtype=numpy.uint8), (len(us1), 1))
+  srtCodesInto(mat, 0, us1); srtCodesInto(mat, len(SRT_CODE)+5, us2)
+  return fixedRows(mat)
+
+def srtRange(t1, t2) -> str:
+  return f"{timedelta_to_srt_timestamp(timedelta(seconds=t1))} --> {timedelta_to_srt_timestamp(timedelta(seconds=t2))}"
+
+def writeSrt(out, starts, ends, contents, start_index=1, reindex=True) -> int:
+  """Write SRT blocks to text file out, as srt.compose would for Subtitle(start, end, content):
+  blocks are sorted by (start, end), ones with blank content, negative start or start >= end are skipped.
+  Without reindex, all blocks are written in given order (as Subtitle.to_srt of each).
+  Returns count of written blocks.
+  """
+  i_block = start_index
+  if numpy == None:
+    blocks = [(timedelta(seconds=t1), timedelta(seconds=t2), i) for (i, (t1, t2)) in enumerate(zip(starts, ends))]
+    for (t1, t2, i) in (sorted(blocks) if reindex else blocks):
+      if reindex and (t1 < timedelta(0) or t1 >= t2 or contents[i].strip() == ""): continue
+      out.write(f"{i_block}\n{timedelta_to_srt_timestamp(t1)} --> {timedelta_to_srt_timestamp(t2)}\n{contents[i]}\n\n"); i_block += 1
+    return i_block - start_index
+  (us1, us2) = (srtMicros(starts), srtMicros(ends))
+  if reindex:
+    keep = numpy.flatnonzero((us1 >= 0) & (us1 < us2)) #< blank contents are checked in the writing loop
+    order = keep[numpy.lexsort((us2[keep], us1[keep]))] #< stable, same as sorting Subtitle tuples
+  else: order = numpy.arange(len(us1))
+  for k in range(0, len(order), N_BATCH):
+    idx = order[k:k+N_BATCH]
+    (b1, b2) = (us1[idx], us2[idx])
+    if len(idx) != 0 and (b1.min() < 0 or max(b1.max(), b2.max()) >= 100*3600*1000000): #< not 2-digit hours
+      ranges = [srtRange(t1/1e6, t2/1e6) for (t1, t2) in zip(b1.tolist(), b2.tolist())]
+    else: ranges = srtRanges(b1, b2)
+    texts = [contents[i] for i in idx.tolist()]
+    lines = []
+    for (rng, text) in zip(ranges, texts):
+      if reindex and text.strip() == "": continue
+      lines.append(f"{i_block}\n{rng}\n{text}\n\n"); i_block += 1
+    out.write("".join(lines))
+  return i_block - start_index
+
+def lrcCode(t) -> str: return "%02i:%02i.%02i" %(t/60, t%60, t%1.0 * 100)
+
+def lrcCodes(seconds, surrs) -> List[str]:
+  """ "mm:ss.xx" (truncated, as lrcCode) for each of seconds, in its pair of surrs chars"""
+  lrcHeader = lambda t, surr: surr[0] + lrcCode(t) + surr[1]
+  if numpy == None or len(seconds) < 64: return list(map(lrcHeader, seconds, surrs)) #< numpy setup costs more for short lines
+  ts = numpy.asarray(seconds, dtype=numpy.float64)
+  m = numpy.trunc(ts/60).astype(numpy.int64)
+  if ts.min() < 0 or m.max() >= 100: return list(map(lrcHeader, seconds, surrs)) #< not 2-digit minutes
+  mat = numpy.empty((len(ts), 10), dtype=numpy.uint8)
+  mat[:, 3] = ord(":"); mat[:, 6] = ord(".")
+  surr_mat = numpy.frombuffer("".join(surrs).encode("ascii"), dtype=numpy.uint8).reshape(-1, 2)
+  (mat[:, 0], mat[:, 9]) = (surr_mat[:, 0], surr_mat[:, 1])
+  for (i, xs) in [(1, m), (4, numpy.trunc(ts % 60)), (7, numpy.trunc(ts % 1.0 * 100))]: digitsInto(mat, i, xs.astype(numpy.int64), 2)
+  return fixedRows(mat)
+
+def formatLrcLines(lines, sep="", surr1="[]", surr2="<>"):
+  """Lazily format lines of (seconds, word), first word of a line in surr1 and others in surr2 (ASCII chars).
+  sep is str, or function of words in the line. Timestamps of up to N_BATCH words are formatted at once.
+  """
+  batch = []; n_words = 0
+  def formatBatch():
+    times = [t for line in batch for (t, _) in line]
+    surrs = [surr2]*len(times); i = 0
+    for line in batch: surrs[i] = surr1; i += len(line)
+    words = [s for line in batch for (_, s) in line]
+    entries = list(map(str.__add__, lrcCodes(times, surrs), words)); i = 0
+    for line in batch:
+      sep1 = sep(words[i:i+len(line)]) if callable(sep) else sep
+      yield entries[i] + sep1 + sep1.join(entries[i+1:i+len(line)]) #< separator follows first word even if it's alone
+      i += len(line)
+  for line in lines:
+    batch.append(line); n_words += len(line)
+    if n_words >= N_BATCH: yield from formatBatch(); batch = []; n_words = 0
+  if len(batch) != 0: yield from formatBatch()
+
+def writeLrc(out, lines, sep="", surr1="[]", surr2="<>", linesep="\n") -> int:
+  """Write formatLrcLines to text file out, each followed by linesep. Returns count of written lines."""
+  n = 0
+  for text in formatLrcLines(lines, sep, surr1, surr2): out.write(text + linesep); n += 1
+  return n
+
+
+Row = Tuple[float, float, int, int, Optional[str]] #< (start, end, pitch, velocity, lyric)
+NO_LYRIC, NO_PITCH = -1, -1 #< NO_PITCH for lyrics recorded without a known pitch
+
+class Timeline:
+  """Columnar notes: start/end seconds (float64), pitch/velocity/lyric (int32) columns, 28 bytes per note.
+  Lyric column holds indices in the interned strings list (or NO_LYRIC), repeated words are stored once.
+  tl[i] is a Row, tl[a:b] is a view over the same columns (no copy, read-only).
+  """
+  COLUMNS = [("starts", "d"), ("ends", "d"), ("pitches", "i"), ("velocities", "i"), ("lyrics", "i")]
+  MAGIC = b"HKTL"
+  def __init__(self):
+    for (name, code) in Timeline.COLUMNS: setattr(self, name, array(code))
+    self.strings:List[str] = []; self._string_ids = {}
+    self.lo, self.hi = 0, None #< window, hi is None for the owner of columns
+  def __len__(self): return (self.hi if self.hi != None else len(self.starts)) - self.lo
+  def __repr__(self): return f"Timeline({len(self)} notes, {len(self.strings)} strings)"
+
+  def intern(self, s:str) -> int:
+    i = self._string_ids.get(s)
+    if i == None: i = self._string_ids[s] = len(self.strings); self.strings.append(s)
+    return i
+  def append(self, t1:float, t2:float, pitch:int, velocity:int=DEFAULT_VELOCITY, lyric:Optional[str]=None):
+    if self.hi != None: raise ValueError("can't append to a timeline view")
+    self.starts.append(t1); self.ends.append(t2); self.pitches.append(pitch); self.velocities.append(velocity)
+    self.lyrics.append(self.intern(lyric) if lyric != None else NO_LYRIC)
+  def extend(self, rows:Iterable[Row]):
+    for row in rows: self.append(*row)
+    return self
+  @staticmethod
+  def fromRows(rows:Iterable[Row]) -> "Timeline": return Timeline().extend(rows)
+
+  def row(self, i:int) -> Row:
+    k = self.lyrics[i]
+    return (self.starts[i], self.ends[i], self.pitches[i], self.velocities[i], self.strings[k] if k != NO_LYRIC else None)
+  def __getitem__(self, key):
+    n = len(self)
+    if isinstance(key, slice):
+      (a, b, step) = key.indices(n)
+      if step != 1: raise ValueError("timeline views need step 1")
+      view = object.__new__(Timeline)
+      view.__dict__.update(self.__dict__)
+      (view.lo, view.hi) = (self.lo + a, self.lo + max(a, b))
+      return view
+    if key < 0: key += n
+    if not 0 <= key < n: raise IndexError(key)
+    return self.row(self.lo + key)
+  def __iter__(self) -> Iterator[Row]:
+    return map(self.row, range(self.lo, self.lo + len(self)))
+
+  def column(self, name:str) -> memoryview:
+    """zero-copy view of a column in this window, owner can't grow while it is alive"""
+    return memoryview(getattr(self, name))[self.lo:self.lo + len(self)]
+  def asNumpy(self) -> dict:
+    """column name: numpy array sharing memory with the column"""
+    return {name: numpy.frombuffer(self.column(name), dtype=numpy.float64 if code == "d" else numpy.int32) for (name, code) in Timeline.COLUMNS}
+  def notes(self) -> Iterator[Tuple[float, float, int]]:
+    return zip(self.column("starts"), self.column("ends"), self.column("pitches"))
+  def contents(self) -> List[str]:
+    """SRT content of each note: its lyric, or else its pitch"""
+    strings = self.strings
+    return [strings[k] if k != NO_LYRIC else str(p) for (k, p) in zip(self.column("lyrics"), self.column("pitches"))]
+  def writeSrt(self, out, reindex=True, start_index=1) -> int:
+    return writeSrt(out, self.column("starts"), self.column("ends"), self.contents(), start_index, reindex)
+
+  def dump(self, f):
+    """write to binary file f: magic, counts, raw little-endian columns, then strings joined by NUL"""
+    blob = "\0".join(self.strings).encode("utf-8")
+    f.write(Timeline.MAGIC + pack("<III", len(self), len(self.strings), len(blob)))
+    for (name, _) in Timeline.COLUMNS:
+      col = getattr(self, name)[self.lo:self.lo + len(self)]
+      if byteorder != "little": col.byteswap()
+      col.tofile(f)
+    f.write(blob)
+  @staticmethod
+  def load(f) -> "Timeline":
+    if f.read(4) != Timeline.MAGIC: raise ValueError("not a timeline dump")
+    (n, n_strings, n_blob) = unpack("<III", f.read(12))
+    tl = Timeline()
+    for (name, _) in Timeline.COLUMNS:
+      col = getattr(tl, name); col.fromfile(f, n)
+      if byteorder != "little": col.byteswap()
+    blob = f.read(n_blob).decode("utf-8")
+    for s in (blob.split("\0") if n_strings != 0 else []): tl.strings.append(s); tl._string_ids[s] = len(tl.strings)-1
+    return tl
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+'''
+Binary timeline file (.hkt), read through mmap without loading or parsing it.
+
+Layout, all little-endian:
+  header (64 bytes): magic "HKTF", version, flags, record size, track count,
+    note count, offsets of records, string heap and track index, heap size
+  records: fixed-width notes (start, end: float64 seconds; pitch: int16; velocity: uint8; track: uint16;
+    lyric offset, length: uint32 in heap, offset is NO_LYRIC for none), sorted by start then end
+  heap: UTF-8 lyrics (and track names), each distinct string stored once
+  track index (optional, HAS_TRACKS flag): per track (name offset, name length, first, count),
+    then uint32 record numbers of all tracks, each track's part in start order
+
+Note N is read in O(1), notes starting in a time window are found by binary search over the records in O(log n).
+'''
+
+from typing import Iterator, List, Optional, Sequence, Tuple
+from struct import Struct
+from mmap import mmap, ACCESS_READ
+from bisect import bisect_left
+from array import array
+from sys import byteorder, getdefaultencoding
+
+from .timeline import Timeline, Row, NO_PITCH, DEFAULT_VELOCITY, numpy
+from .hachitools import EXT_TIMELINE as EXT
+
+MAGIC, VERSION = b"HKTF", 1
+HAS_TRACKS = 0x1
+HEADER = Struct("<4sHHIIQQQQQ8x") #< magic, version, flags, record size, n_tracks, n_notes, off_records, off_heap, off_tracks, n_heap
+RECORD = Struct("<ddhBxHxxII") #< start, end, pitch, velocity, track, lyric offset, lyric length
+TRACK = Struct("<IIQQ") #< name offset, name length, first index, count
+NO_LYRIC = 0xffffffff
+
+RECORD_DTYPE = numpy.dtype({"names": ["start", "end", "pitch", "velocity", "track", "lyric_off", "lyric_len"],
+  "formats": ["<f8", "<f8", "<i2", "u1", "<u2", "<u4", "<u4"], "offsets": [0, 8, 16, 18, 20, 24, 28], "itemsize": RECORD.size}) if numpy != None else None
+
+def writeTimelineFile(out, timeline:Timeline, tracks:Optional[Sequence[int]]=None, track_names:Optional[List[str]]=None) -> int:
+  """Write timeline to binary file out, with track index when tracks (track number of each note) is given.
+  Returns count of written notes.
+  """
+  n = len(timeline)
+  (starts, ends) = (timeline.column("starts"), timeline.column("ends"))
+  if numpy != None: order = numpy.lexsort((numpy.frombuffer(ends, dtype=numpy.float64), numpy.frombuffer(starts, dtype=numpy.float64))).tolist()
+  else: order = sorted(range(n), key=lambda i: (starts[i], ends[i]))
+  heap = bytearray(); heap_ids = {}
+  def heapString(s) -> Tuple[int, int]:
+    if s not in heap_ids:
+      bs = s.encode("utf-8"); heap_ids[s] = (len(heap), len(bs)); heap.extend(bs)
+    return heap_ids[s]
+  records = bytearray(n*RECORD.size)
+  for (k, i) in enumerate(order):
+    (t1, t2, pitch, velocity, lyric) = timeline[i]
+    (off, length) = heapString(lyric) if lyric != None else (NO_LYRIC, 0)
+    RECORD.pack_into(records, k*RECORD.size, t1, t2, pitch, velocity, tracks[i] if tracks != None else 0, off, length)
+
+  n_tracks = 0; index = b""
+  if tracks != None:
+    n_tracks = max(max(tracks, default=-1) + 1, len(track_names or []))
+    parts = [array("I") for _ in range(n_tracks)]
+    for (k, i) in enumerate(order): parts[tracks[i]].append(k)
+    entries = bytearray(); first = 0
+    for (i_track, part) in enumerate(parts):
+      (off, length) = heapString(track_names[i_track] if track_names != None and i_track < len(track_names) else "")
+      entries += TRACK.pack(off, length, first, len(part)); first += len(part)
+    indices = array("I", (k for part in parts for k in part))
+    if byteorder != "little": indices.byteswap()
+    index = bytes(entries) + indices.tobytes()
+  off_records = HEADER.size
+  off_heap = off_records + len(records)
+  off_tracks = off_heap + len(heap) if tracks != None else 0
+  out.write(HEADER.pack(MAGIC, VERSION, HAS_TRACKS if tracks != None else 0, RECORD.size, n_tracks, n, off_records, off_heap, off_tracks, len(heap)))
+  out.write(records); out.write(heap); out.write(index)
+  return n
+
+class RecordField:
+  """lazy sequence of one record field, for bisect without loading the file"""
+  def __init__(self, file:"TimelineFile", fmt:str, offset:int):
+    self.file = file; self.unpack = Struct(fmt).unpack_from; self.offset = offset
+  def __len__(self): return len(self.file)
+  def __getitem__(self, i): return self.unpack(self.file.buf, self.file.off_records + i*RECORD.size + self.offset)[0]
+
+class TimelineFile:
+  """Read-only mmap view of a .hkt file: tf[i] is a Row, tf.window(t1, t2) the notes starting in [t1, t2)"""
+  def __init__(self, path):
+    with open(path, "rb") as f: self.mm = mmap(f.fileno(), 0, access=ACCESS_READ) #< mapping stays valid after close
+    self.buf = memoryview(self.mm)
+    if len(self.buf) < HEADER.size or self.buf[0:4] != MAGIC: self.close(); raise ValueError(f"not a timeline file: {path}")
+    (_, version, self.flags, record_size, self.n_tracks, self.n_notes, self.off_records, self.off_heap, self.off_tracks, n_heap) = HEADER.unpack_from(self.buf, 0)
+    if version > VERSION or record_size != RECORD.size: self.close(); raise ValueError(f"unsupported timeline file version {version}: {path}")
+    self.heap = self.buf[self.off_heap:self.off_heap + n_heap]
+    self.starts = RecordField(self, "<d", 0)
+  def close(self):
+    self.heap = None; self.buf.release(); self.mm.close()
+  def __enter__(self): return self
+  def __exit__(self, *exc): self.close()
+  def __len__(self): return self.n_notes
+  def __repr__(self): return f"TimelineFile({self.n_notes} notes, {self.n_tracks} tracks)"
+
+  def string(self, off:int, length:int) -> Optional[str]:
+    return str(self.heap[off:off+length], "utf-8") if off != NO_LYRIC else None
+  def record(self, i:int) -> Tuple[float, float, int, int, int, int, int]:
+    if not 0 <= i < self.n_notes: raise IndexError(i)
+    return RECORD.unpack_from(self.buf, self.off_records + i*RECORD.size)
+  def __getitem__(self, i:int) -> Row:
+    (t1, t2, pitch, velocity, _, off, length) = self.record(i if i >= 0 else i + self.n_notes)
+    return (t1, t2, pitch, velocity, self.string(off, length))
+  def __iter__(self) -> Iterator[Row]: return map(self.__getitem__, range(self.n_notes))
+  def track(self, i:int) -> int: return self.record(i)[4]
+
+  def window(self, t1:float, t2:float) -> range:
+    """record numbers of notes starting in [t1, t2), by binary search"""
+    return range(bisect_left(self.starts, t1), bisect_left(self.starts, t2))
+  def notesIn(self, t1:float, t2:float) -> Iterator[Row]: return map(self.__getitem__, self.window(t1, t2))
+
+  def trackNames(self) -> List[str]:
+    return [self.string(*TRACK.unpack_from(self.buf, self.off_tracks + i*TRACK.size)[0:2]) for i in range(self.n_tracks)]
+  def trackNotes(self, i_track:int) -> memoryview:
+    """record numbers (uint32, zero-copy) of notes in a track, in start order"""
+    if not self.flags & HAS_TRACKS: raise ValueError("timeline file has no track index")
+    (_, _, first, count) = TRACK.unpack_from(self.buf, self.off_tracks + i_track*TRACK.size)
+    off = self.off_tracks + self.n_tracks*TRACK.size + first*4
+    return self.buf[off:off + count*4].cast("I")
+  def asNumpy(self):
+    """records as numpy structured array sharing the mapping, drop it before close()"""
+    return numpy.frombuffer(self.buf, dtype=RECORD_DTYPE, count=self.n_notes, offset=self.off_records)
+  def toTimeline(self) -> Timeline: return Timeline.fromRows(self)
+
+
+def readTimeline(path) -> Tuple[Timeline, Optional[List[int]], Optional[List[str]]]:
+  """(timeline, track of each note, track names) from .hkt, .srt, .lrc or MIDI file; tracks are known for .hkt and MIDI"""
+  lower = path.lower()
+  if lower.endswith(EXT):
+    with TimelineFile(path) as tf:
+      tracks = [tf.track(i) for i in range(len(tf))] if tf.flags & HAS_TRACKS else None
+      return (tf.toTimeline(), tracks, tf.trackNames() if tracks != None else None)
+  if lower.endswith((".mid", ".midi")):
+    from mido import MidiFile
+    from .cli_tools.srt2mid import transformBack, SINGLE_TRACK
+    midi = MidiFile(path, charset=getdefaultencoding())
+    tracks = array("i")
+    is_lyrics = any(msg.type == "lyrics" for track in midi.tracks for msg in track) #< then notes without lyrics are dropped
+    timeline = transformBack(midi, is_lyrics, tracks)
+    names = [next((msg.name for msg in track if msg.type == "track_name"), "") for track in midi.tracks]
+    return (timeline, tracks, [max(zip(midi.tracks, names), key=lambda p: len(p[0]))[1]] if SINGLE_TRACK else names)
+  if lower.endswith(".lrc"):
+    from .cli_tools.lrc_merge import scanLrc, lrcChunks
+    with open(path, "rb") as f: return (Timeline.fromRows((t, t, NO_PITCH, DEFAULT_VELOCITY, s) for (t, s) in scanLrc(lrcChunks(f))), None, None)
+  from .cli_tools.srt2mid import readSrtStream
+  with open(path, "r", encoding="utf-8") as f:
+    timeline = Timeline()
+    for srt in readSrtStream(f):
+      content = srt.content
+      pitch = int(content) if content.strip().isdigit() else NO_PITCH
+      timeline.append(srt.start.total_seconds(), srt.end.total_seconds(), pitch, lyric=content if pitch == NO_PITCH else None)
+    return (timeline, None, None)
+
+def packFile(path, path_out) -> int:
+  """.srt/.lrc/MIDI file into .hkt"""
+  (timeline, tracks, names) = readTimeline(path)
+  with open(path_out, "wb") as out: return writeTimelineFile(out, timeline, tracks, names)
+
+def unpackFile(path, path_out) -> int:
+  """.hkt into .srt, .lrc (one line per note) or MIDI (lyrics are sung on their pitch, notes must not overlap)"""
+  lower = path_out.lower()
+  with TimelineFile(path) as tf:
+    if lower.endswith((".mid", ".midi")):
+      from .cli_tools.srt2mid import transformStream, NOTE_BASE
+      is_lyrics = any(tf.record(i)[5] != NO_LYRIC for i in range(len(tf)))
+      rows = ((t1, t2, pitch if pitch != NO_PITCH else NOTE_BASE, velocity, lyric or "") for (t1, t2, pitch, velocity, lyric) in tf)
+      with open(path_out, "wb") as out: return transformStream(rows, is_lyrics, out)
+    timeline = tf.toTimeline()
+  with open(path_out, "w", encoding="utf-8") as out:
+    if lower.endswith(".lrc"):
+      from .timeline import writeLrc
+      return writeLrc(out, ([(t1, s)] for (t1, s) in zip(timeline.column("starts"), timeline.contents())))
+    from .timeline import writeSrt
+    (starts, ends, contents) = (timeline.column("starts"), timeline.column("ends"), timeline.contents())
+    keep = [i for (i, s) in enumerate(contents) if s.strip() != ""] #< SRT can't hold blank blocks (e.g. empty lyrics), srt.parse would stop at them
+    return writeSrt(out, [starts[i] for i in keep], [ends[i] for i in keep], [contents[i] for i in keep], reindex=False)
+
+from argparse import ArgumentParser
+app = ArgumentParser(prog="hachiko-timeline", description=f"convert between {EXT} binary timeline and SRT/LRC/MIDI files",
+  epilog=f"direction is decided by extensions, one of the files must be {EXT}")
+app.add_argument("file", type=str, help="input file")
+app.add_argument("file_out", type=str, help="output file")
+
+from sys import argv
+def main(args = argv[1:]):
+  cfg = app.parse_args(args)
+  if cfg.file.lower().endswith(EXT) and not cfg.file_out.lower().endswith(EXT): n = unpackFile(cfg.file, cfg.file_out)
+  elif cfg.file_out.lower().endswith(EXT): n = packFile(cfg.file, cfg.file_out)
+  else: app.error(f"one of the files must be {EXT}")
+  print(f"{cfg.file} -> {cfg.file_out}: {n} notes")
+
+if __name__ == "__main__": main()
@@ -41,6 +41,9 @@ This program requires system FluidSynth library to run, this package also provid
     "console_scripts": [
       "hachiko = hachiko_bapu.hachi:main",
       "hachiko-groups = hachiko_bapu.hachi_groups:main",
+      "hachiko-render = hachiko_bapu.render:main",
+      "hachiko-timeline = hachiko_bapu.timeline_file:main",
+      "hachiko-probe = hachiko_bapu.probe:main",
       "srt2mid = hachiko_bapu.cli_tools.srt2mid:main",
       "lrc_merge = hachiko_bapu.cli_tools.lrc_merge:main"
     ]
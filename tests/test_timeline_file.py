@@ -0,0 +1,16 @@
+from srt import parse
+
+from hachiko_bapu.timeline import Timeline, NO_PITCH
+from hachiko_bapu.timeline_file import writeTimelineFile, unpackFile
+
+def test_unpack_srt_parses(tmp_path):
+  timeline = Timeline()
+  timeline.append(0.5, 1.0, 60)
+  timeline.append(1.0, 1.5, NO_PITCH, lyric="")
+  timeline.append(1.5, 2.0, NO_PITCH, lyric="la")
+  timeline.append(2.0, 2.0, NO_PITCH, lyric="li") #< LRC words are packed without duration
+  (path, path_out) = (tmp_path / "a.hkt", tmp_path / "a.srt")
+  with open(path, "wb") as f: writeTimelineFile(f, timeline)
+  assert unpackFile(str(path), str(path_out)) == 3
+  subs = list(parse(path_out.read_text(encoding="utf-8")))
+  assert [(s.index, s.start.total_seconds(), s.content) for s in subs] == [(1, 0.5, "60"), (2, 1.5, "la"), (3, 2.0, "li")]